@@ -1,22 +1,157 @@
-import subprocess
+import os
 import json
+import time
+import asyncio
+from collections import Counter
+import bitcoin_rpc
 
-def add_peers(addresses):
-    for address in addresses:
-        result = subprocess.run(['bitcoin-cli', 'addnode', address, 'onetry'], capture_output=True, text=True)
-        if result.returncode == 0:
-            print(f"Added peer: {address}")
-        else:
-            print(f"Failed to add peer: {address}")
-            print(result.stderr)
-
-# Run 'bitcoin-cli getnodeaddresses 80000' command and parse the JSON response
-result = subprocess.run(['bitcoin-cli', 'getnodeaddresses', '80000'], capture_output=True, text=True)
-if result.returncode == 0:
-    response = result.stdout.strip()
-    data = json.loads(response)
-    addresses = [entry['address'] for entry in data]
-    add_peers(addresses)
-else:
-    print("Failed to retrieve node addresses.")
-    print(result.stderr)
+# Adjustable variables
+NETWORKS = ['ipv4', 'ipv6', 'onion', 'i2p']  # Networks whose addresses are tried
+MAX_ADDRESSES = 80000  # Number of addresses requested from getnodeaddresses
+MAX_CONCURRENCY = 4  # Number of batches in flight at the same time
+BATCH_SIZE = 100  # addnode calls per JSON-RPC batch
+MAX_ATTEMPTS_PER_SECOND = 200  # Upper limit for outbound connection attempts
+RETRY_TTL = 6 * 60 * 60  # Seconds before an address is tried again
+TRIED_FILE = '../bitcoin-data/tried_addresses.json'  # Last attempt per address
+
+
+def get_network(entry):
+    if 'network' in entry:
+        return entry['network']
+    address = entry['address']
+    if address.endswith('.onion'):
+        return 'onion'
+    if address.endswith('.i2p'):
+        return 'i2p'
+    if ':' in address:
+        return 'ipv6'
+    return 'ipv4'
+
+def format_node(entry):
+    address = entry['address']
+    port = entry.get('port')
+    if port is None:
+        return address
+    if get_network(entry) in ('ipv6', 'cjdns'):
+        return f"[{address}]:{port}"
+    return f"{address}:{port}"
+
+def load_tried_addresses(file_path, ttl):
+    if not os.path.exists(file_path):
+        return {}
+    try:
+        with open(file_path, 'r') as file:
+            tried = json.load(file)
+    except json.JSONDecodeError:
+        return {}
+    now = time.time()
+    return {node: tried_at for node, tried_at in tried.items() if now - tried_at < ttl}
+
+def save_tried_addresses(file_path, tried):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(tried, file)
+    os.replace(temp_path, file_path)
+
+def select_nodes(entries, networks, tried, stats):
+    nodes = []
+    seen = set()
+    for entry in entries:
+        if get_network(entry) not in networks:
+            stats['filtered'] += 1
+            continue
+        node = format_node(entry)
+        if node in tried or node in seen:
+            stats['skipped'] += 1
+            continue
+        seen.add(node)
+        nodes.append(node)
+    return nodes
+
+
+class RateLimiter:
+    # Token bucket holding up to `capacity` tokens, refilled with `rate` tokens per second
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+async def dispatch(client, nodes, tried, stats, failures):
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    limiter = RateLimiter(MAX_ATTEMPTS_PER_SECOND, max(MAX_ATTEMPTS_PER_SECOND, BATCH_SIZE))
+
+    async def send_batch(batch):
+        async with semaphore:
+            await limiter.acquire(len(batch))
+            calls = [('addnode', [node, 'onetry']) for node in batch]
+            try:
+                results = await asyncio.to_thread(client.batch, calls, len(calls))
+            except (bitcoin_rpc.RPCError, OSError) as e:
+                results = [e] * len(batch)
+            now = time.time()
+            for node, result in zip(batch, results):
+                tried[node] = now
+                if isinstance(result, Exception):
+                    stats['failed'] += 1
+                    failures[str(getattr(result, 'message', result))] += 1
+                else:
+                    stats['added'] += 1
+
+    batches = [nodes[start:start + BATCH_SIZE] for start in range(0, len(nodes), BATCH_SIZE)]
+    await asyncio.gather(*(send_batch(batch) for batch in batches))
+
+def print_stats(stats, failures, elapsed):
+    attempted = stats['added'] + stats['failed']
+    print(f"Addresses received: {stats['received']}")
+    print(f"Filtered by network: {stats['filtered']}")
+    print(f"Skipped (tried within {RETRY_TTL}s): {stats['skipped']}")
+    print(f"Added peers: {stats['added']}")
+    print(f"Failed: {stats['failed']}")
+    if elapsed > 0:
+        print(f"Throughput: {attempted / elapsed:.1f} addnode calls/s ({elapsed:.2f}s)")
+    if failures:
+        print("Failure reasons:")
+    for reason, count in failures.most_common():
+        print(f"    {reason}: {count}")
+
+def main():
+    stats = Counter()
+    failures = Counter()
+
+    try:
+        client = bitcoin_rpc.RPCClient(pool_size=MAX_CONCURRENCY)
+        data = client.call('getnodeaddresses', MAX_ADDRESSES)
+    except (bitcoin_rpc.RPCError, OSError) as e:
+        print("Failed to retrieve node addresses.")
+        print(e)
+        return
+
+    stats['received'] = len(data)
+    tried = load_tried_addresses(TRIED_FILE, RETRY_TTL)
+    nodes = select_nodes(data, NETWORKS, tried, stats)
+
+    start = time.perf_counter()
+    asyncio.run(dispatch(client, nodes, tried, stats, failures))
+    elapsed = time.perf_counter() - start
+
+    save_tried_addresses(TRIED_FILE, tried)
+    client.close()
+    print_stats(stats, failures, elapsed)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 import re
-from collections import Counter
+from cooccurrence import count_combinations, sort_pair_stats
 
 def is_excluded_address(ip_address):
     excluded_prefixes = ['127.0.0.', '[::]', '91.198.115.', '162.218.65.', '209.222.252.']
@@ -34,33 +34,16 @@ def parse_log_file(log_file_path):
 
     return ip_groups
 
-def count_combinations(ip_groups, time_window):
-    combinations_count = Counter()
-    for ip_address, timestamps in ip_groups.items():
-        for other_ip_address, other_timestamps in ip_groups.items():
-            if ip_address != other_ip_address:
-                for timestamp in timestamps:
-                    for other_timestamp in other_timestamps:
-                        if abs(timestamp - other_timestamp) <= time_window:
-                            combination = tuple(sorted((ip_address, other_ip_address)))  # Sort the addresses in the tuple
-                            combinations_count[combination] += 1
-
-    return combinations_count
-
-def write_combinations_count_to_file(combinations_count, count_file_path, ip_groups):
+def write_combinations_count_to_file(sorted_pairs, count_file_path):
     with open(count_file_path, 'w') as count_file:
         count_file.write("Address combinations count:\n")
-        for combination, count in sorted(combinations_count.items(), key=lambda x: (-x[1], min(abs(timestamp - other_timestamp) for timestamp in ip_groups[x[0][0]] for other_timestamp in ip_groups[x[0][1]]))):
-            count //= 2  # Divide the count by two since the combinations are counted twice
-            time_diff = min(abs(timestamp - other_timestamp) for timestamp in ip_groups[combination[0]]
-                            for other_timestamp in ip_groups[combination[1]])
-            count_file.write(f"{combination[0]} related to {combination[1]} (Count: {count}, Time Difference: {time_diff})\n")
+        for combination, stats in sorted_pairs:
+            count_file.write(f"{combination[0]} related to {combination[1]} (Count: {stats['count']}, Time Difference: {stats['time_diff']})\n")
 
-def write_suspect_peer_addresses_to_file(combinations_count, peer_file_path, ip_groups):
+def write_suspect_peer_addresses_to_file(sorted_pairs, peer_file_path):
     with open(peer_file_path, 'w') as peer_file:
-        for combination, count in sorted(combinations_count.items(), key=lambda x: (-x[1], min(abs(timestamp - other_timestamp) for timestamp in ip_groups[x[0][0]] for other_timestamp in ip_groups[x[0][1]]))):
-            for _ in range(count // 2):
-                peer_file.write(f"{combination[0]}; {combination[1]}\n")
+        for combination, stats in sorted_pairs:
+            peer_file.write(f"{combination[0]}; {combination[1]}\n" * stats['count'])
 
 def main():
     log_file_path = '../bitcoin-data/peer_connect.log'
@@ -70,21 +53,19 @@ def main():
     time_window = timedelta(seconds=10)
 
     ip_groups = parse_log_file(log_file_path)
-    combinations_count = count_combinations(ip_groups, time_window)
+    pair_stats = count_combinations(ip_groups, time_window)
+    sorted_pairs = sort_pair_stats(pair_stats)
 
-    if not combinations_count:
+    if not sorted_pairs:
         print("No address combinations found.")
     else:
         print("Address combinations count (sorted by count in descending order):")
-        for combination, count in sorted(combinations_count.items(), key=lambda x: (-x[1], min(abs(timestamp - other_timestamp) for timestamp in ip_groups[x[0][0]] for other_timestamp in ip_groups[x[0][1]]))):
-            count //= 2  # Divide the count by two since the combinations are counted twice
-            time_diff = min(abs(timestamp - other_timestamp) for timestamp in ip_groups[combination[0]]
-                            for other_timestamp in ip_groups[combination[1]])
-            print(f"{combination[0]} related to {combination[1]} (Count: {count}, Time Difference: {time_diff})")
+        for combination, stats in sorted_pairs:
+            print(f"{combination[0]} related to {combination[1]} (Count: {stats['count']}, Time Difference: {stats['time_diff']})")
 
-    if combinations_count:
-        write_combinations_count_to_file(combinations_count, count_file_path, ip_groups)
-        write_suspect_peer_addresses_to_file(combinations_count, peer_file_path, ip_groups)
+    if sorted_pairs:
+        write_combinations_count_to_file(sorted_pairs, count_file_path)
+        write_suspect_peer_addresses_to_file(sorted_pairs, peer_file_path)
 
 if __name__ == "__main__":
     main()
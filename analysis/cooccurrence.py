@@ -0,0 +1,49 @@
+def merge_events(ip_groups):
+    # One time-sorted stream of (timestamp, address index) for all addresses
+    addresses = list(ip_groups.keys())
+    events = []
+    for index, address in enumerate(addresses):
+        for timestamp in ip_groups[address]:
+            events.append((timestamp, index))
+    events.sort()
+    return addresses, events
+
+def count_combinations(ip_groups, time_window):
+    addresses, events = merge_events(ip_groups)
+
+    stats_by_index = {}
+    left = 0
+    for right, (timestamp, index) in enumerate(events):
+        # Drop events that are too old to be paired with the current one
+        while timestamp - events[left][0] > time_window:
+            left += 1
+        for other_timestamp, other_index in events[left:right]:
+            if other_index == index:
+                continue
+            pair = (other_index, index) if other_index < index else (index, other_index)
+            time_diff = timestamp - other_timestamp
+            stats = stats_by_index.get(pair)
+            if stats is None:
+                stats_by_index[pair] = {
+                    'count': 1,
+                    'time_diff': time_diff,
+                    'first_seen': other_timestamp,
+                    'last_seen': timestamp
+                }
+            else:
+                stats['count'] += 1
+                if time_diff < stats['time_diff']:
+                    stats['time_diff'] = time_diff
+                stats['last_seen'] = timestamp
+
+    # Keep the order in which the addresses were first seen in the log, so ties are reported as before
+    pair_stats = {}
+    for pair in sorted(stats_by_index):
+        combination = tuple(sorted((addresses[pair[0]], addresses[pair[1]])))
+        pair_stats[combination] = stats_by_index[pair]
+
+    return pair_stats
+
+def sort_pair_stats(pair_stats):
+    # Highest count first, closest co-occurrence first for equal counts
+    return sorted(pair_stats.items(), key=lambda x: (-x[1]['count'], x[1]['time_diff']))
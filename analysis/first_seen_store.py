@@ -0,0 +1,56 @@
+import sqlite3
+
+# First sighting of a transaction per network class, kept across hash log files and runs.
+# Transactions are keyed by their 32 byte binary txid. Only sightings that can still matter for a later
+# file are kept: everything older than `retention_us` before the newest sighting expires.
+
+LOOKUP_CHUNK = 500  # Txids per query, below SQLite's limit of host parameters
+
+class FirstSeenStore:
+    def __init__(self, path, retention_us):
+        self.retention_us = retention_us
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS first_seen ("
+            "network TEXT NOT NULL, txid BLOB NOT NULL, peer TEXT NOT NULL, time_us INTEGER NOT NULL, "
+            "PRIMARY KEY (network, txid)) WITHOUT ROWID"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS first_seen_time ON first_seen (time_us)")
+        newest = self.connection.execute("SELECT MAX(time_us) FROM first_seen").fetchone()[0]
+        self.newest_us = newest if newest is not None else -1
+
+    def may_contain(self, epoch_us):
+        # Lookups are only needed while the store still holds sightings within the retention
+        return epoch_us - self.retention_us <= self.newest_us
+
+    def lookup_many(self, network, txids):
+        # txid -> (peer, time_us) of the given txids that are in the store, queried in chunks
+        txids = list(txids)
+        found = {}
+        for start in range(0, len(txids), LOOKUP_CHUNK):
+            chunk = txids[start:start + LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            for txid, peer, time_us in self.connection.execute(
+                f"SELECT txid, peer, time_us FROM first_seen WHERE network = ? AND txid IN ({placeholders})",
+                [network] + chunk
+            ):
+                found[bytes(txid)] = (peer, time_us)
+        return found
+
+    def add(self, sightings):
+        # sightings: iterable of (network, txid, peer, time_us), existing first sightings are kept
+        rows = list(sightings)
+        self.connection.executemany("INSERT OR IGNORE INTO first_seen VALUES (?, ?, ?, ?)", rows)
+        for row in rows:
+            if row[3] > self.newest_us:
+                self.newest_us = row[3]
+
+    def expire(self):
+        self.connection.execute("DELETE FROM first_seen WHERE time_us < ?", (self.newest_us - self.retention_us,))
+
+    def commit(self):
+        self.expire()
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -1,49 +1,98 @@
 import os
+import re
+import sys
+import time
 from datetime import datetime, timedelta
 from tqdm import tqdm
 
-def parse_data_file(file_path):
-    with open(file_path, 'r') as file:
-        data = file.read()
-        lines = data.strip().split("\n")
-        parsed_data = []
-        current_peer = None
-        current_time = None
-        current_transactions = []
-
-        for line in lines:
-            if line.startswith("Peer:"):
-                if current_peer is not None:
-                    parsed_data.append({"Peer": current_peer, "Time": current_time, "Transaktionen": current_transactions})
-                    current_transactions = []
-
-                try:
-                    current_peer = line.split("Peer: ")[1].split(",")[0]
-                    current_time = line.split("Time: ")[1].split(",")[0]
-                    inventory_hash = line.split(", Inventory Hash: ")[1][10:]
-                except Exception as e:
-                    print(f"Error parsing {file_path}: {e}")
-                    return []
-                while inventory_hash:
-                    transaction = inventory_hash[:64]
-                    current_transactions.append(transaction)
-                    if len(inventory_hash) > 64:
-                        inventory_hash = inventory_hash[72:]  # Skip 8 characters for the next transaction
-                    else:
-                        break
-
-        if current_peer is not None:
-            parsed_data.append({"Peer": current_peer, "Time": current_time, "Transaktionen": current_transactions})
-
-    return parsed_data
-
-def parse_time(time_str):
-    date = str(time_str)
-    if date.startswith("1900-01-01 "):
-        date = date.replace("1900-01-01 ", "")
-        date = date.replace(".", ":")
-    date = ":".join(date.split(":")[-3:])
-    return date
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from segment_writer import open_segment, sealed_segments, strip_compression
+from first_seen_store import FirstSeenStore
+from sightings import TXID_BYTES, load_sightings
+from relay_latency import update_profiles
+from txid_minhash import update_signatures
+
+HASH_SEPARATOR = ", Inventory Hash: "
+HASH_PREFIX_LENGTH = 10  # Characters before the first transaction hash
+TXID_LENGTH = 64
+TXID_STRIDE = 72  # 64 hex characters followed by 8 characters until the next hash
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+SECOND_US = 1000000
+HOUR_US = 3600 * SECOND_US
+DAY_US = 24 * HOUR_US
+
+# [date] [hours:]minutes:seconds:fraction, the date and the hours may be missing
+TIME_PATTERN = re.compile(r'(?:(\d{4})-(\d{2})-(\d{2})[ T_])?(?:(\d{1,2}):)?(\d{1,2}):(\d{1,2})[:.](\d{1,6})$')
+
+def to_epoch_us(dt):
+    return (dt.toordinal() - EPOCH_ORDINAL) * DAY_US + (dt.hour * 3600 + dt.minute * 60 + dt.second) * SECOND_US + dt.microsecond
+
+def format_time(epoch_us):
+    return (EPOCH + timedelta(microseconds=epoch_us)).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def get_reference_time(file_path):
+    # Rotated files are named after the time they were saved, used to place times without a date
+    file_name = os.path.basename(file_path)
+    try:
+        return to_epoch_us(datetime.strptime(file_name[:19], '%Y-%m-%d_%H-%M-%S'))
+    except ValueError:
+        return to_epoch_us(datetime.fromtimestamp(os.path.getmtime(file_path)))
+
+def parse_timestamp(time_str, previous_us):
+    match = TIME_PATTERN.search(time_str.strip())
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, fraction = match.groups()
+    offset = (int(minute) * 60 + int(second)) * SECOND_US + int(fraction.ljust(6, '0'))
+
+    if year is not None:
+        day_us = (datetime(int(year), int(month), int(day)).toordinal() - EPOCH_ORDINAL) * DAY_US
+        return day_us + int(hour or 0) * HOUR_US + offset
+
+    # Without a date (or without hours) the time is placed in the day (or hour) closest to the previous line,
+    # so files that run over midnight or a full hour keep increasing times
+    if hour is not None:
+        offset += int(hour) * HOUR_US
+        period = DAY_US
+    else:
+        period = HOUR_US
+    candidate = previous_us - previous_us % period + offset
+    if candidate - previous_us > period // 2:
+        candidate -= period
+    elif previous_us - candidate > period // 2:
+        candidate += period
+    return candidate
+
+def iter_hash_records(file_path, reference_us=None, errors=None):
+    # Yields one (peer, epoch_microseconds, txid) record per announced transaction, reading the file line by line
+    previous_us = get_reference_time(file_path) if reference_us is None else reference_us
+    with open_segment(file_path) as file:
+        for line in file:
+            if not line.startswith("Peer:"):
+                continue
+            try:
+                peer_end = line.index(",", 6)
+                peer = line[6:peer_end]
+                time_start = line.index("Time: ", peer_end) + 6
+                time_end = line.index(",", time_start)
+                hash_start = line.index(HASH_SEPARATOR, time_end) + len(HASH_SEPARATOR) + HASH_PREFIX_LENGTH
+            except ValueError:
+                if errors is not None:
+                    errors['lines'] += 1
+                continue
+
+            epoch_us = parse_timestamp(line[time_start:time_end], previous_us)
+            if epoch_us is None:
+                if errors is not None:
+                    errors['timestamps'] += 1
+                continue
+            previous_us = epoch_us
+
+            hashes = line.rstrip("\r\n")
+            for position in range(hash_start, len(hashes), TXID_STRIDE):
+                yield peer, epoch_us, hashes[position:position + TXID_LENGTH]
 
 def is_filtered_ip(ip):
     filtered_ips = ['127.0.0.', '[::]', '91.198.115.', '162.218.65.', '209.222.252.']
@@ -52,58 +101,90 @@ def is_filtered_ip(ip):
             return True
     return False
 
-def find_suspicious_transactions(parsed_data):
+ONION_WINDOW = 200 * 1000  # Microseconds
+IP_WINDOW = 100 * 1000
+FIRST_SEEN_RETENTION = 60 * 60 * 1000 * 1000  # First sightings are kept for an hour across files
+
+def lookup_first_seen(sightings, filtered, store):
+    # First sightings from the store of every transaction whose first sighting in this file is within the store
+    # window, read with one query per chunk instead of one per transaction
+    peers = sightings.peers
+    peer_ids, times, txids = sightings.peer_ids, sightings.times, sightings.txids
+    candidates = {'Onion': {}, 'IP': {}}
+    for row in range(len(sightings)):
+        peer_id = peer_ids[row]
+        if filtered[peer_id]:
+            continue
+        network_candidates = candidates['Onion' if peers.onion[peer_id] else 'IP']
+        transaction = bytes(txids[row * TXID_BYTES:(row + 1) * TXID_BYTES])
+        if transaction not in network_candidates:
+            network_candidates[transaction] = store.may_contain(times[row])
+    return {
+        network: store.lookup_many(network, [transaction for transaction, wanted in network_candidates.items() if wanted])
+        for network, network_candidates in candidates.items()
+    }
+
+def find_suspicious_transactions(sightings, store=None):
+    peers = sightings.peers
+    filtered = [is_filtered_ip(peer) for peer in peers.names]
+    peer_ids, times, txids = sightings.peer_ids, sightings.times, sightings.txids
+    stored_first_seen = lookup_first_seen(sightings, filtered, store) if store is not None else {'Onion': {}, 'IP': {}}
+    # First sighting per network: binary txid -> row in the sightings table
     onion_transactions = {}
     ip_transactions = {}
     suspicious_groups = {}
+    newest_us = None
 
-    for entry in parsed_data:
-        peer = entry['Peer']
-        if is_filtered_ip(peer):
+    for row in range(len(sightings)):
+        peer_id = peer_ids[row]
+        if filtered[peer_id]:
             continue
-
-        parsed_time = parse_time(entry['Time'])
-        time = datetime.strptime(parsed_time, '%M:%S:%f')
-
-        for transaction in entry['Transaktionen']:
-            if ".onion" in peer:
-                if transaction in onion_transactions:
-                    prev_time = datetime.strptime(parse_time(onion_transactions[transaction]['Time']), '%M:%S:%f')
-                    time_diff = abs(time - prev_time)
-                    if time_diff <= timedelta(milliseconds=200):
-                        if transaction not in suspicious_groups:
-                            suspicious_groups[transaction] = {
-                                'Transaction': transaction,
-                                'First Network': onion_transactions[transaction]['Network'],
-                                'First Time': parse_time(onion_transactions[transaction]['Time']),
-                                'Second Network': 'Onion',
-                                'Second Time': parsed_time,
-                                'Time Difference': time_diff,
-                                'Suspect Addresses': [onion_transactions[transaction]['Peer'], peer]
-                            }
-                        else:
-                            suspicious_groups[transaction]['Suspect Addresses'].append(peer)
-                else:
-                    onion_transactions[transaction] = {'Peer': peer, 'Time': time, 'Network': 'Onion'}
-            else:
-                if transaction in ip_transactions:
-                    prev_time = datetime.strptime(parse_time(ip_transactions[transaction]['Time']), '%M:%S:%f')
-                    time_diff = abs(time - prev_time)
-                    if time_diff <= timedelta(milliseconds=100):
-                        if transaction not in suspicious_groups:
-                            suspicious_groups[transaction] = {
-                                'Transaction': transaction,
-                                'First Network': ip_transactions[transaction]['Network'],
-                                'First Time': parse_time(ip_transactions[transaction]['Time']),
-                                'Second Network': 'IP',
-                                'Second Time': parsed_time,
-                                'Time Difference': time_diff,
-                                'Suspect Addresses': [ip_transactions[transaction]['Peer'], peer]
-                            }
-                        else:
-                            suspicious_groups[transaction]['Suspect Addresses'].append(peer)
+        epoch_us = times[row]
+        transaction = bytes(txids[row * TXID_BYTES:(row + 1) * TXID_BYTES])
+        if newest_us is None or epoch_us > newest_us:
+            newest_us = epoch_us
+
+        if peers.onion[peer_id]:
+            transactions, network, window = onion_transactions, 'Onion', ONION_WINDOW
+        else:
+            transactions, network, window = ip_transactions, 'IP', IP_WINDOW
+
+        # A transaction first seen at the end of a previous file is taken from the persistent store
+        if transaction not in transactions:
+            first_seen = stored_first_seen[network].get(transaction)
+            if first_seen is not None:
+                transactions[transaction] = sightings.append(first_seen[0], first_seen[1], transaction)
+
+        first_row = transactions.get(transaction)
+        if first_row is not None:
+            prev_us = times[first_row]
+            time_diff = abs(epoch_us - prev_us)
+            if time_diff <= window:
+                if transaction not in suspicious_groups:
+                    suspicious_groups[transaction] = {
+                        'Transaction': transaction.hex(),
+                        'First Network': network,
+                        'First Time': format_time(prev_us),
+                        'Second Network': network,
+                        'Second Time': format_time(epoch_us),
+                        'Time Difference': timedelta(microseconds=time_diff),
+                        'Suspect Addresses': [sightings.peer(first_row), peers.names[peer_id]],
+                        'Row': row  # Sighting that opened the group, orders groups when shards are merged
+                    }
                 else:
-                    ip_transactions[transaction] = {'Peer': peer, 'Time': time, 'Network': 'IP'}
+                    suspicious_groups[transaction]['Suspect Addresses'].append(peers.names[peer_id])
+        else:
+            transactions[transaction] = row
+
+    if store is not None and newest_us is not None:
+        horizon = newest_us - FIRST_SEEN_RETENTION
+        store.add(
+            (network, transaction, sightings.peer(row), times[row])
+            for network, transactions in (('Onion', onion_transactions), ('IP', ip_transactions))
+            for transaction, row in transactions.items()
+            if times[row] >= horizon
+        )
+        store.commit()
 
     # Check and update suspect groups with mixed address types
     for transaction, group_info in suspicious_groups.items():
@@ -134,70 +215,103 @@ def find_suspicious_transactions(parsed_data):
 
     return suspicious_groups
 
+def write_suspicious_groups(suspicious_groups, output_file_path, suspect_addr_file_path):
+    with open(output_file_path, "a") as output_file:
+        for transaction, group_info in suspicious_groups.items():
+            output_file.write(f"Transaction: {group_info['Transaction']}\n")
+            output_file.write(f"First Network: {group_info['First Network']}, Time: {group_info['First Time']}\n")
+            output_file.write(f"Second Network: {group_info['Second Network']}, Time: {group_info['Second Time']}\n")
+            output_file.write(f"Time Difference: {group_info['Time Difference']}\n")
+            output_file.write(f"Suspect Addresses: {group_info['Suspect Addresses']}\n")
+
+            if 'Mixed Addresses' in group_info:
+                output_file.write("-" * 80 + "\n")
+                mixed_addresses = group_info['Mixed Addresses']
+                mixed_addresses_details = group_info['Mixed Addresses Details']
+                output_file.write(f"Mixed Addresses: {mixed_addresses}\n")
+                output_file.write(f"First Address Type: {mixed_addresses_details['First Address Type']}\n")
+                output_file.write(f"Second Address Type: {mixed_addresses_details['Second Address Type']}\n")
+
+                if 'Time Between Address Changes' in group_info:
+                    time_diff_between_addresses = group_info['Time Between Address Changes']
+                    for address_change in time_diff_between_addresses:
+                        output_file.write(f"Time Between {address_change[0]} and {address_change[1]}: {address_change[2]}\n")
+
+                mixed_addresses_str = f"{mixed_addresses[0]}; {mixed_addresses[1]}\n"
+                with open(suspect_addr_file_path, "a") as suspect_addr_file:
+                    suspect_addr_file.write(mixed_addresses_str)
+
+            output_file.write("=" * 80 + "\n\n")
+
 # Directory paths
-input_directory = "../bitcoin-data/hashes/hash_saves"
-output_directory = "../bitcoin-data/analysis/hashes"
-suspect_addr_directory = "../bitcoin-data/analysis/suspect_addr"
-
-# Get a list of all files in the input directory
-input_files = [f for f in os.listdir(input_directory) if f.endswith("_incoming_hashes.log") and "-00-" not in f and "-55-" not in f]
-
-# Load the list of checked files
-checked_files_file = "../bitcoin-data/hashes/checked_hash_files.txt"
-if os.path.exists(checked_files_file):
-    with open(checked_files_file, "r") as checked_files:
-        checked_files_list = checked_files.read().splitlines()
-else:
-    checked_files_list = []
-
-log_file = open("../bitcoin-data/analysis/hashes/hashes_processing.log", "a")
-
-pbar = tqdm(total=len(input_files), desc="Processing Files", unit="file")
-
-for idx, file_name in enumerate(input_files, start=1):
-    if file_name not in checked_files_list:
-        file_path = os.path.join(input_directory, file_name)
-        parsed_data = parse_data_file(file_path)
-        suspicious_groups = find_suspicious_transactions(parsed_data)
-
-        output_file_name = file_name.replace("_incoming_hashes.log", f"_{idx // 10:02d}.log")
-        output_file_path = os.path.join(output_directory, output_file_name)
-
-        with open(output_file_path, "a") as output_file:
-            for transaction, group_info in suspicious_groups.items():
-                output_file.write(f"Transaction: {group_info['Transaction']}\n")
-                output_file.write(f"First Network: {group_info['First Network']}, Time: {group_info['First Time']}\n")
-                output_file.write(f"Second Network: {group_info['Second Network']}, Time: {group_info['Second Time']}\n")
-                output_file.write(f"Time Difference: {group_info['Time Difference']}\n")
-                output_file.write(f"Suspect Addresses: {group_info['Suspect Addresses']}\n")
-
-                if 'Mixed Addresses' in group_info:
-                    output_file.write("-" * 80 + "\n")
-                    mixed_addresses = group_info['Mixed Addresses']
-                    mixed_addresses_details = group_info['Mixed Addresses Details']
-                    output_file.write(f"Mixed Addresses: {mixed_addresses}\n")
-                    output_file.write(f"First Address Type: {mixed_addresses_details['First Address Type']}\n")
-                    output_file.write(f"Second Address Type: {mixed_addresses_details['Second Address Type']}\n")
-
-                    if 'Time Between Address Changes' in group_info:
-                        time_diff_between_addresses = group_info['Time Between Address Changes']
-                        for address_change in time_diff_between_addresses:
-                            output_file.write(f"Time Between {address_change[0]} and {address_change[1]}: {address_change[2]}\n")
-
-                    mixed_addresses_str = f"{mixed_addresses[0]}; {mixed_addresses[1]}\n"
-                    with open("../bitcoin-data/analysis/suspect_addr/hashes_sus.log", "a") as suspect_addr_file:
-                        suspect_addr_file.write(mixed_addresses_str)
-
-                output_file.write("=" * 80 + "\n\n")
-
-        with open(checked_files_file, "a") as checked_files:
-            checked_files.write(file_name + "\n")
-
-        log_file.write(f"Processed: {file_name}\n")
+INPUT_DIRECTORY = "../bitcoin-data/hashes/hash_saves"
+OUTPUT_DIRECTORY = "../bitcoin-data/analysis/hashes"
+SUSPECT_ADDR_FILE = "../bitcoin-data/analysis/suspect_addr/hashes_sus.log"
+CHECKED_FILES_FILE = "../bitcoin-data/hashes/checked_hash_files.txt"
+PROCESSING_LOG_FILE = "../bitcoin-data/analysis/hashes/hashes_processing.log"
+FIRST_SEEN_FILE = "../bitcoin-data/analysis/hashes/first_seen.sqlite"  # Shared with hash_shards
+
+def get_pending_files():
+    # (index, file name) of every unchecked file, the index names the output file
+    # Sealed segments in the order they were written, so first sightings carry over to the next file
+    input_files = [f for f in sealed_segments(INPUT_DIRECTORY, "_incoming_hashes.log") if "-00-" not in f and "-55-" not in f]
+
+    # Load the list of checked files
+    if os.path.exists(CHECKED_FILES_FILE):
+        with open(CHECKED_FILES_FILE, "r") as checked_files:
+            checked_files_list = set(checked_files.read().splitlines())
+    else:
+        checked_files_list = set()
+
+    return [(idx, file_name) for idx, file_name in enumerate(input_files, start=1) if file_name not in checked_files_list]
+
+def finish_file(idx, file_name, suspicious_groups):
+    output_file_name = strip_compression(file_name).replace("_incoming_hashes.log", f"_{idx // 10:02d}.log")
+    output_file_path = os.path.join(OUTPUT_DIRECTORY, output_file_name)
+    write_suspicious_groups(suspicious_groups, output_file_path, SUSPECT_ADDR_FILE)
+
+    with open(CHECKED_FILES_FILE, "a") as checked_files:
+        checked_files.write(file_name + "\n")
+
+    # Delete the processed file
+    os.remove(os.path.join(INPUT_DIRECTORY, file_name))
+
+def format_processing_log(file_name, file_size_mb, elapsed, errors, sightings_count, sightings_mb):
+    throughput = file_size_mb / elapsed if elapsed > 0 else 0.0
+    line = f"Processed: {file_name} ({file_size_mb:.1f} MB in {elapsed:.2f}s, {throughput:.1f} MB/s"
+    line += f", skipped lines: {errors['lines']}, bad timestamps: {errors['timestamps']}, bad txids: {errors['txids']}"
+    line += f", {sightings_count} sightings in {sightings_mb:.1f} MB)\n"
+    return line
+
+def main():
+    pending_files = get_pending_files()
+    store = FirstSeenStore(FIRST_SEEN_FILE, FIRST_SEEN_RETENTION)
+    log_file = open(PROCESSING_LOG_FILE, "a")
+
+    pbar = tqdm(total=len(pending_files), desc="Processing Files", unit="file")
+
+    for idx, file_name in pending_files:
+        file_path = os.path.join(INPUT_DIRECTORY, file_name)
+        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
+        errors = {'lines': 0, 'timestamps': 0, 'txids': 0}
+
+        start = time.perf_counter()
+        sightings = load_sightings(iter_hash_records(file_path, errors=errors), errors=errors)
+        # Latency profiles and signatures are built before the first-seen store appends sightings of earlier files
+        update_profiles(sightings, is_filtered_ip, store=store)
+        update_signatures(sightings, is_filtered_ip)
+        suspicious_groups = find_suspicious_transactions(sightings, store)
+        elapsed = time.perf_counter() - start
+
+        finish_file(idx, file_name, suspicious_groups)
+
+        log_file.write(format_processing_log(file_name, file_size_mb, elapsed, errors, len(sightings), sightings.nbytes() / (1024 * 1024)))
+        pbar.set_postfix(mb_s=f"{file_size_mb / elapsed if elapsed > 0 else 0.0:.1f}")
         pbar.update(1)
 
-        # Delete the processed file
-        os.remove(file_path)
-
-log_file.close()
+    pbar.close()
+    store.close()
+    log_file.close()
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import os
+import time
+import pickle
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+import hash_analysis
+from hash_analysis import FIRST_SEEN_RETENTION, find_suspicious_transactions, is_filtered_ip, iter_hash_records
+from first_seen_store import FirstSeenStore
+from sightings import Sightings, load_sightings
+from relay_latency import LatencyProfiles, build_profiles, store_profiles
+from txid_minhash import Signatures, build_signatures, store_signatures
+
+# Map-reduce mode of hash_analysis. All state of find_suspicious_transactions is per transaction, so sightings can be
+# partitioned by txid prefix and every shard analyzed on its own:
+#   map:    every hash log file is parsed once and split into one partition per shard (parallel over files)
+#   reduce: every shard runs over its partitions in file order with its own first-seen store (parallel over shards)
+#   merge:  per file the groups of all shards are ordered by the sighting that opened them, so the output matches
+#           a single process run; latency profiles and MinHash signatures of the shards are merged as well
+# The shard first-seen stores are seeded from the shared first-seen store of hash_analysis in the map step and written
+# back to it in the merge step, so single process runs and runs with any shard count continue from the same state.
+# The steps only communicate through SHARD_DIRECTORY, so with a shared directory each reduce can run on another host.
+
+SHARD_DIRECTORY = "../bitcoin-data/analysis/hashes/shards"
+COPY_ROWS = 10000  # First-seen rows copied between the shared and the shard stores at once
+
+def get_shards(sightings, num_shards):
+    # Shard of every row from the first two bytes of the txid
+    txids = np.frombuffer(sightings.txids, dtype=np.uint8).reshape(-1, 32)
+    return ((txids[:, 0].astype(np.int64) << 8) | txids[:, 1]) % num_shards
+
+def get_shard(txid, num_shards):
+    return ((txid[0] << 8) | txid[1]) % num_shards
+
+def partition_path(directory, file_name, shard, num_shards):
+    return os.path.join(directory, f"{file_name}.{shard:03d}-of-{num_shards:03d}.npz")
+
+def result_path(directory, shard, num_shards):
+    return os.path.join(directory, f"result.{shard:03d}-of-{num_shards:03d}.pickle")
+
+def store_path(directory, shard, num_shards):
+    return os.path.join(directory, f"first_seen.{shard:03d}-of-{num_shards:03d}.sqlite")
+
+def iter_store_rows(store):
+    cursor = store.connection.execute("SELECT network, txid, peer, time_us FROM first_seen")
+    while True:
+        rows = cursor.fetchmany(COPY_ROWS)
+        if not rows:
+            return
+        yield rows
+
+def seed_shard_stores(num_shards, directory=SHARD_DIRECTORY):
+    # Every shard store starts over with the transactions of its shard from the shared first-seen store
+    shared = FirstSeenStore(hash_analysis.FIRST_SEEN_FILE, FIRST_SEEN_RETENTION)
+    stores = []
+    for shard in range(num_shards):
+        path = store_path(directory, shard, num_shards)
+        if os.path.exists(path):
+            os.remove(path)
+        stores.append(FirstSeenStore(path, FIRST_SEEN_RETENTION))
+    for rows in iter_store_rows(shared):
+        shard_rows = [[] for store in stores]
+        for row in rows:
+            shard_rows[get_shard(row[1], num_shards)].append(row)
+        for store, selected in zip(stores, shard_rows):
+            store.add(selected)
+    for store in stores:
+        store.commit()
+        store.close()
+    shared.close()
+
+def write_back_shard_stores(num_shards, directory=SHARD_DIRECTORY):
+    # First sightings kept at the shared first-seen store stay, the ones added by the shards are inserted
+    shared = FirstSeenStore(hash_analysis.FIRST_SEEN_FILE, FIRST_SEEN_RETENTION)
+    for shard in range(num_shards):
+        path = store_path(directory, shard, num_shards)
+        store = FirstSeenStore(path, FIRST_SEEN_RETENTION)
+        for rows in iter_store_rows(store):
+            shared.add(rows)
+        store.close()
+        os.remove(path)
+    shared.commit()
+    shared.close()
+
+def map_file(file_name, num_shards, directory=SHARD_DIRECTORY):
+    file_path = os.path.join(hash_analysis.INPUT_DIRECTORY, file_name)
+    errors = {'lines': 0, 'timestamps': 0, 'txids': 0}
+    start = time.perf_counter()
+    sightings = load_sightings(iter_hash_records(file_path, errors=errors), errors=errors)
+    peer_ids, times, txids = sightings.as_numpy()
+    names = np.array(sightings.peers.names, dtype=str)
+    shards = get_shards(sightings, num_shards)
+    for shard in range(num_shards):
+        rows = np.flatnonzero(shards == shard)
+        path = partition_path(directory, file_name, shard, num_shards)
+        np.savez(path + ".tmp.npz", names=names, rows=rows, peer_ids=peer_ids[rows], times=times[rows], txids=txids[rows])
+        os.replace(path + ".tmp.npz", path)
+    return {'errors': errors, 'sightings': len(sightings), 'nbytes': sightings.nbytes(), 'elapsed': time.perf_counter() - start}
+
+def manifest_path(directory, num_shards):
+    return os.path.join(directory, f"files.{num_shards:03d}.txt")
+
+def read_manifest(directory, num_shards):
+    # Files mapped by the map step, in order, so a late reduce does not pick up files that arrived in between
+    with open(manifest_path(directory, num_shards), "r") as f:
+        return f.read().splitlines()
+
+def load_partition(path):
+    with np.load(path) as data:
+        sightings = Sightings.from_columns(data['names'].tolist(), data['peer_ids'], data['times'], data['txids'])
+        return sightings, data['rows']
+
+def reduce_shard(file_names, shard, num_shards, directory=SHARD_DIRECTORY):
+    # Transactions never change their shard, so the seeded shard store holds every first sighting the shard needs
+    store = FirstSeenStore(store_path(directory, shard, num_shards), FIRST_SEEN_RETENTION)
+    results = {}
+    for file_name in file_names:
+        sightings, rows = load_partition(partition_path(directory, file_name, shard, num_shards))
+        profiles = build_profiles(sightings, is_filtered_ip, store)
+        signatures = build_signatures(sightings, is_filtered_ip)
+        suspicious_groups = find_suspicious_transactions(sightings, store)
+        for group_info in suspicious_groups.values():
+            group_info['Row'] = int(rows[group_info['Row']])
+        results[file_name] = (suspicious_groups, profiles, signatures)
+    store.close()
+
+    path = result_path(directory, shard, num_shards)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(results, f)
+    os.replace(path + ".tmp", path)
+    return path
+
+def merge_results(file_name, shard_results):
+    suspicious_groups = {}
+    day_profiles = {}
+    day_signatures = {}
+    for results in shard_results:
+        groups, profiles, signatures = results[file_name]
+        suspicious_groups.update(groups)
+        for date, shard_profiles in profiles.items():
+            day_profiles.setdefault(date, LatencyProfiles()).merge(shard_profiles)
+        for date, shard_signatures in signatures.items():
+            day_signatures.setdefault(date, Signatures()).merge(shard_signatures)
+    ordered = dict(sorted(suspicious_groups.items(), key=lambda item: item[1]['Row']))
+    return ordered, day_profiles, day_signatures
+
+def merge_shards(pending_files, num_shards, map_stats=None, directory=SHARD_DIRECTORY):
+    shard_results = []
+    for shard in range(num_shards):
+        with open(result_path(directory, shard, num_shards), "rb") as f:
+            shard_results.append(pickle.load(f))
+
+    with open(hash_analysis.PROCESSING_LOG_FILE, "a") as log_file:
+        for idx, file_name in pending_files:
+            suspicious_groups, day_profiles, day_signatures = merge_results(file_name, shard_results)
+            store_profiles(day_profiles)
+            store_signatures(day_signatures)
+            if map_stats is not None:
+                stats = map_stats[file_name]
+                file_size_mb = os.path.getsize(os.path.join(hash_analysis.INPUT_DIRECTORY, file_name)) / (1024 * 1024)
+                log_file.write(hash_analysis.format_processing_log(
+                    file_name, file_size_mb, stats['elapsed'], stats['errors'], stats['sightings'], stats['nbytes'] / (1024 * 1024)
+                ))
+            hash_analysis.finish_file(idx, file_name, suspicious_groups)
+
+            for shard in range(num_shards):
+                os.remove(partition_path(directory, file_name, shard, num_shards))
+
+    write_back_shard_stores(num_shards, directory)
+    for shard in range(num_shards):
+        os.remove(result_path(directory, shard, num_shards))
+
+def run_local(num_shards, workers=None):
+    # A local process pool stands in for the hosts
+    os.makedirs(SHARD_DIRECTORY, exist_ok=True)
+    pending_files = hash_analysis.get_pending_files()
+    file_names = [file_name for idx, file_name in pending_files]
+    if not file_names:
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        map_results = executor.map(map_file, file_names, [num_shards] * len(file_names))
+        map_stats = dict(zip(file_names, tqdm(map_results, total=len(file_names), desc="Map", unit="file")))
+        seed_shard_stores(num_shards)
+
+        reduce_results = executor.map(reduce_shard, [file_names] * num_shards, range(num_shards), [num_shards] * num_shards)
+        for path in tqdm(reduce_results, total=num_shards, desc="Reduce", unit="shard"):
+            pass
+
+    merge_shards(pending_files, num_shards, map_stats)
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze hash logs in shards partitioned by txid prefix')
+    parser.add_argument('--shards', type=int, default=os.cpu_count(), help='Number of shards')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes of the local pool')
+    parser.add_argument('--step', choices=['local', 'map', 'reduce', 'merge'], default='local',
+                        help='Run all steps with a local pool, or a single step (e.g. one reduce per host)')
+    parser.add_argument('--shard', type=int, help='Shard of the reduce step')
+    args = parser.parse_args()
+
+    if args.step == 'local':
+        run_local(args.shards, args.workers)
+        return
+
+    os.makedirs(SHARD_DIRECTORY, exist_ok=True)
+    pending_files = hash_analysis.get_pending_files()
+    file_names = [file_name for idx, file_name in pending_files]
+    if args.step == 'map':
+        map_stats = {file_name: map_file(file_name, args.shards) for file_name in tqdm(file_names, desc="Map", unit="file")}
+        seed_shard_stores(args.shards)
+        with open(manifest_path(SHARD_DIRECTORY, args.shards) + ".pickle", "wb") as f:
+            pickle.dump(map_stats, f)
+        with open(manifest_path(SHARD_DIRECTORY, args.shards), "w") as f:
+            f.write("".join(file_name + "\n" for file_name in file_names))
+    elif args.step == 'reduce':
+        reduce_shard(read_manifest(SHARD_DIRECTORY, args.shards), args.shard, args.shards)
+    else:
+        mapped_files = set(read_manifest(SHARD_DIRECTORY, args.shards))
+        with open(manifest_path(SHARD_DIRECTORY, args.shards) + ".pickle", "rb") as f:
+            map_stats = pickle.load(f)
+        merge_shards([(idx, file_name) for idx, file_name in pending_files if file_name in mapped_files], args.shards, map_stats)
+        os.remove(manifest_path(SHARD_DIRECTORY, args.shards) + ".pickle")
+        os.remove(manifest_path(SHARD_DIRECTORY, args.shards))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import os
+import numpy as np
+from datetime import datetime, timedelta
+from sightings import TXID_BYTES
+
+# Relay latency profile per peer and day: for every transaction announced by at least two peers, each peer's first
+# announcement is ranked by its delay to the first announcement of any peer and counted in a fixed-bin histogram.
+# Peers relaying through the same node (e.g. the IP and onion side of a bridge) end up with near-identical profiles.
+# Transactions first announced in an earlier file (found in the first-seen store) are left out, their first
+# announcement is not in this file, so delays and ranks would be measured from the wrong start.
+
+LATENCY_BINS = np.array([0, 1, 5, 10, 25, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]) * 1000  # Lower edges in microseconds
+MIN_ANNOUNCEMENTS = 2  # Peers announcing a transaction before it counts
+MIN_PROFILE_TRANSACTIONS = 200  # Transactions a peer must have announced before its profile is compared
+PROFILE_DISTANCE = 0.05  # Maximum Hellinger distance between two profiles
+COMPARE_CHUNK = 1024  # Onion profiles compared at once
+
+PROFILE_DIRECTORY = "../bitcoin-data/analysis/hashes/latency_profiles"
+EPOCH = datetime(1970, 1, 1)
+DAY_US = 24 * 3600 * 1000000
+
+class LatencyProfiles:
+    def __init__(self):
+        self.index = {}
+        self.names = []
+        self.counts = np.zeros((0, len(LATENCY_BINS)), dtype=np.int64)
+        self.rank_sums = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def rows(self, names):
+        # Row of every name, new peers get an empty profile
+        new_names = [name for name in dict.fromkeys(names) if name not in self.index]
+        if new_names:
+            for name in new_names:
+                self.index[name] = len(self.names)
+                self.names.append(name)
+            self.counts = np.vstack([self.counts, np.zeros((len(new_names), len(LATENCY_BINS)), dtype=np.int64)])
+            self.rank_sums = np.concatenate([self.rank_sums, np.zeros(len(new_names), dtype=np.int64)])
+        return np.array([self.index[name] for name in names], dtype=np.int64)
+
+    def add(self, names, counts, rank_sums):
+        rows = self.rows(names)
+        self.counts[rows] += counts
+        self.rank_sums[rows] += rank_sums
+
+    def merge(self, other):
+        self.add(other.names, other.counts, other.rank_sums)
+
+    def totals(self):
+        return self.counts.sum(axis=1)
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, names=np.array(self.names, dtype=str), counts=self.counts, rank_sums=self.rank_sums)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        profiles = cls()
+        if os.path.exists(path):
+            with np.load(path) as data:
+                profiles.add(list(data['names']), data['counts'], data['rank_sums'])
+        return profiles
+
+
+def get_earlier_txids(sightings, store):
+    # Transactions of this file that the first-seen store already has from an earlier file, on either network
+    peer_ids, times, txids = sightings.as_numpy()
+    if store is None or len(txids) == 0 or not store.may_contain(int(times.min())):
+        return np.zeros(0, dtype=f'S{TXID_BYTES}')
+    # S32 values drop trailing zero bytes, they are padded again for the lookup
+    unique = [bytes(txid).ljust(TXID_BYTES, b'\0') for txid in np.unique(txids)]
+    earlier = set()
+    for network in ('Onion', 'IP'):
+        earlier.update(store.lookup_many(network, unique))
+    return np.array(sorted(earlier), dtype=f'S{TXID_BYTES}')
+
+def compute_latencies(sightings, is_filtered=None, store=None):
+    # Returns (peer ids, days, delays in microseconds, ranks) of every first announcement per transaction and peer
+    earlier_txids = get_earlier_txids(sightings, store)
+    peer_ids, times, txids = sightings.as_numpy()
+    if is_filtered is not None:
+        filtered = np.array([is_filtered(name) for name in sightings.peers.names], dtype=bool)
+        keep = ~filtered[peer_ids]
+        peer_ids, times, txids = peer_ids[keep], times[keep], txids[keep]
+    if len(earlier_txids):
+        keep = ~np.isin(txids, earlier_txids)
+        peer_ids, times, txids = peer_ids[keep], times[keep], txids[keep]
+
+    # Only the first announcement of a transaction by each peer counts
+    order = np.lexsort((times, peer_ids, txids))
+    peer_ids, times, txids = peer_ids[order], times[order], txids[order]
+    first = np.ones(len(txids), dtype=bool)
+    first[1:] = (txids[1:] != txids[:-1]) | (peer_ids[1:] != peer_ids[:-1])
+    peer_ids, times, txids = peer_ids[first], times[first], txids[first]
+
+    # Announcements of a transaction ordered by time, the delay is measured to the start of its group
+    order = np.lexsort((times, txids))
+    peer_ids, times, txids = peer_ids[order], times[order], txids[order]
+    group_start = np.ones(len(txids), dtype=bool)
+    group_start[1:] = txids[1:] != txids[:-1]
+    start_index = np.maximum.accumulate(np.where(group_start, np.arange(len(txids)), 0))
+    group_size = np.diff(np.append(np.flatnonzero(group_start), len(txids)))
+    keep = np.repeat(group_size, group_size) >= MIN_ANNOUNCEMENTS
+
+    delays = times - times[start_index]
+    ranks = np.arange(len(txids)) - start_index
+    return peer_ids[keep], times[start_index][keep] // DAY_US, delays[keep], ranks[keep]
+
+def build_profiles(sightings, is_filtered=None, store=None):
+    # Histograms per day of a (usually single) hash log file, the store must not contain this file yet
+    peer_ids, days, delays, ranks = compute_latencies(sightings, is_filtered, store)
+    bins = np.searchsorted(LATENCY_BINS, delays, side='right') - 1
+    n_peers, n_bins = len(sightings.peers), len(LATENCY_BINS)
+
+    day_profiles = {}
+    for day in np.unique(days):
+        in_day = days == day
+        counts = np.bincount(peer_ids[in_day] * n_bins + bins[in_day], minlength=n_peers * n_bins).reshape(n_peers, n_bins)
+        rank_sums = np.bincount(peer_ids[in_day], weights=ranks[in_day], minlength=n_peers).astype(np.int64)
+        active = np.flatnonzero(counts.sum(axis=1))
+        profiles = LatencyProfiles()
+        profiles.add([sightings.peers.names[peer_id] for peer_id in active], counts[active], rank_sums[active])
+        date = (EPOCH + timedelta(days=int(day))).strftime('%Y-%m-%d')
+        day_profiles[date] = profiles
+    return day_profiles
+
+def update_profiles(sightings, is_filtered=None, directory=PROFILE_DIRECTORY, store=None):
+    # Called by hash_analysis for every processed file, before find_suspicious_transactions updates the store
+    store_profiles(build_profiles(sightings, is_filtered, store), directory)
+
+def store_profiles(day_profiles, directory=PROFILE_DIRECTORY):
+    os.makedirs(directory, exist_ok=True)
+    for date, profiles in day_profiles.items():
+        path = os.path.join(directory, f"{date}.npz")
+        stored = LatencyProfiles.load(path)
+        stored.merge(profiles)
+        stored.save(path)
+
+def compare_profiles(profiles):
+    # Hellinger distance between every onion and every IP profile, computed as matrix products in chunks
+    totals = profiles.totals()
+    candidates = np.flatnonzero(totals >= MIN_PROFILE_TRANSACTIONS)
+    onion = np.array([".onion" in profiles.names[row] for row in candidates], dtype=bool)
+    onion_rows, ip_rows = candidates[onion], candidates[~onion]
+    if len(onion_rows) == 0 or len(ip_rows) == 0:
+        return []
+
+    roots = np.sqrt(profiles.counts / np.maximum(totals, 1)[:, None])
+    ip_roots = roots[ip_rows].T
+    pairs = []
+    for chunk_start in range(0, len(onion_rows), COMPARE_CHUNK):
+        chunk = onion_rows[chunk_start:chunk_start + COMPARE_CHUNK]
+        distances = np.sqrt(np.clip(1 - roots[chunk] @ ip_roots, 0, None))
+        for i, j in zip(*np.nonzero(distances <= PROFILE_DISTANCE)):
+            pairs.append((ip_rows[j], chunk[i], distances[i, j]))
+    pairs.sort(key=lambda pair: pair[2])
+    return pairs
+
+def write_profile_pairs(date, profiles, pairs, detail_file, suspect_addr_file):
+    totals = profiles.totals()
+    for ip_row, onion_row, distance in pairs:
+        suspect_addr_file.write(f"{profiles.names[ip_row]}; {profiles.names[onion_row]}\n")
+        detail_file.write(f"Date: {date}\n")
+        detail_file.write(f"Hellinger Distance: {distance:.4f}\n")
+        for row in (ip_row, onion_row):
+            mean_rank = profiles.rank_sums[row] / totals[row]
+            detail_file.write(f"Address: {profiles.names[row]}, Transactions: {totals[row]}, Mean Rank: {mean_rank:.2f}\n")
+            detail_file.write(f"Histogram: {profiles.counts[row].tolist()}\n")
+        detail_file.write("=" * 80 + "\n\n")
+
+def main():
+    compared_days_file = "../bitcoin-data/analysis/hashes/compared_latency_days.txt"
+    detail_file_path = "../bitcoin-data/analysis/detail/latency_analysis_output.log"
+    suspect_addr_file_path = "../bitcoin-data/analysis/suspect_addr/latency_sus.log"
+
+    compared_days = set()
+    if os.path.exists(compared_days_file):
+        with open(compared_days_file, "r") as f:
+            compared_days = set(f.read().splitlines())
+
+    # The current day is still being written by hash_analysis
+    today = datetime.now().strftime('%Y-%m-%d')
+    dates = sorted(f[:-len(".npz")] for f in os.listdir(PROFILE_DIRECTORY) if f.endswith(".npz") and not f.endswith(".tmp.npz"))
+    dates = [date for date in dates if date < today and date not in compared_days]
+
+    with open(detail_file_path, "a") as detail_file, open(suspect_addr_file_path, "a") as suspect_addr_file:
+        for date in dates:
+            profiles = LatencyProfiles.load(os.path.join(PROFILE_DIRECTORY, f"{date}.npz"))
+            pairs = compare_profiles(profiles)
+            write_profile_pairs(date, profiles, pairs, detail_file, suspect_addr_file)
+            print(f"{date}: {len(profiles)} peers, {len(pairs)} similar profiles")
+
+            with open(compared_days_file, "a") as f:
+                f.write(date + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 import os
+import sys
 import subprocess
 import json
 import re
 from datetime import datetime, timedelta
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import bitcoin_rpc
+import peer_store
+
 DUAL_IPV4 = 0
 DUAL_IPV4_ONION = 0
 DUAL_ONION_ONION = 0
@@ -149,31 +154,20 @@ def print_peer_info(addresses, peerinfo):
     data_folder = "../bitcoin-data/daily_json_files/"
     
     for addr in addr_list:
-        matching_files = []
-        for filename in os.listdir(data_folder):
+        # Walk the days from newest to oldest and stop at the first day the address was seen
+        for date in reversed(peer_store.list_dates(data_folder)):
             try:
-                if filename.endswith(".json"):
-                    file_path = os.path.join(data_folder, filename)
-                    with open(file_path, "r") as file:
-                        data = json.load(file)
-                        if any(peer.get("addr", "").startswith(addr) for peer in data):
-                            matching_files.append(file_path)
+                matching_peers = [peer for peer in peer_store.iter_peers(date, data_folder) if peer.get("addr", "").startswith(addr)]
             except ValueError:
+                print(f"File of {date} is broken")
                 continue
 
-        try:
-            if matching_files:
-                newest_file = max(matching_files, key=os.path.getctime)
-                with open(newest_file, "r") as file:
-                    data = json.load(file)
-                for peer in data:
-                    if peer.get("addr", "").startswith(addr):
-                        print(f"Last Seen in {newest_file}")
-                        print(peer)
-                        print(f"\n")
-        except ValueError:
-            print(f"Newest File {filename} is broken")
-            continue
+            if matching_peers:
+                for peer in matching_peers:
+                    print(f"Last Seen in {date}")
+                    print(peer)
+                    print(f"\n")
+                break
 
 def address_combination_type(addresses):
     global DUAL_IPV4
@@ -213,6 +207,8 @@ def main():
         "connect_sus.log",
         "disconnect_sus.log",
         "hashes_sus.log",
+        "latency_sus.log",
+        "minhash_sus.log",
         "ping_sus.log",
         "static_sus.log"
     ]
@@ -221,8 +217,11 @@ def main():
     unique_address_pairs = set()  # Set to store unique address pairs
     added_address_pairs = 0  # Counter for added address pairs
 
-    peer_info_cmd = run_command("bitcoin-cli getpeerinfo")
-    peerinfo = json.dumps(peer_info_cmd)
+    try:
+        peerinfo = bitcoin_rpc.call('getpeerinfo')
+    except (bitcoin_rpc.RPCError, OSError) as e:
+        print(f"Error retrieving peer info: {e}")
+        peerinfo = []
 
     for log_file in log_files:
         file_path = os.path.join(folder_path, log_file)
@@ -0,0 +1,85 @@
+from array import array
+
+TXID_BYTES = 32
+
+# Column-wise storage for transaction sightings from the hash logs: peers are interned to small integer ids,
+# times are int64 microseconds since the epoch and txids are stored as consecutive 32 byte binary values.
+
+class PeerTable:
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.onion = []
+
+    def intern(self, peer):
+        peer_id = self.ids.get(peer)
+        if peer_id is None:
+            peer_id = self.ids[peer] = len(self.names)
+            self.names.append(peer)
+            self.onion.append(".onion" in peer)
+        return peer_id
+
+    def __len__(self):
+        return len(self.names)
+
+
+class Sightings:
+    def __init__(self, peers=None):
+        self.peers = peers if peers is not None else PeerTable()
+        self.peer_ids = array('I')
+        self.times = array('q')
+        self.txids = bytearray()
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, peer, epoch_us, txid):
+        self.peer_ids.append(self.peers.intern(peer))
+        self.times.append(epoch_us)
+        self.txids += txid
+        return len(self.times) - 1
+
+    def txid(self, row):
+        return bytes(self.txids[row * TXID_BYTES:(row + 1) * TXID_BYTES])
+
+    def peer(self, row):
+        return self.peers.names[self.peer_ids[row]]
+
+    def nbytes(self):
+        return self.peer_ids.itemsize * len(self.peer_ids) + self.times.itemsize * len(self.times) + len(self.txids)
+
+    @classmethod
+    def from_columns(cls, names, peer_ids, times, txids):
+        # Rebuilds a table from the columns of as_numpy(), e.g. after they were saved with numpy
+        sightings = cls()
+        for name in names:
+            sightings.peers.intern(name)
+        sightings.peer_ids.frombytes(peer_ids.astype('uint32').tobytes())
+        sightings.times.frombytes(times.astype('int64').tobytes())
+        sightings.txids += txids.tobytes()
+        return sightings
+
+    def as_numpy(self):
+        # Zero-copy views (peer ids, times, txids as S32), the table must not grow while they are in use
+        import numpy as np
+        return (
+            np.frombuffer(self.peer_ids, dtype=np.uint32),
+            np.frombuffer(self.times, dtype=np.int64),
+            np.frombuffer(self.txids, dtype=f'S{TXID_BYTES}')
+        )
+
+
+def load_sightings(records, sightings=None, errors=None):
+    # records: iterable of (peer, epoch_us, txid hex string), e.g. from hash_analysis.iter_hash_records
+    sightings = sightings if sightings is not None else Sightings()
+    for peer, epoch_us, txid in records:
+        try:
+            txid_bytes = bytes.fromhex(txid)
+        except ValueError:
+            txid_bytes = b''
+        if len(txid_bytes) != TXID_BYTES:
+            if errors is not None:
+                errors['txids'] = errors.get('txids', 0) + 1
+            continue
+        sightings.append(peer, epoch_us, txid_bytes)
+    return sightings
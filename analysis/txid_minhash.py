@@ -0,0 +1,219 @@
+import os
+import argparse
+import numpy as np
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# MinHash signature of the set of transactions each peer announced per hour. Signatures of the same peer are merged
+# by taking the element-wise minimum, so a day (or several days) is compared without reading the hash logs again.
+# Similar peers are found with locality-sensitive hashing on bands of the signature instead of comparing all pairs.
+# The number of distinct transactions is estimated from the signature as well, so it follows the minimum on merges
+# and a transaction announced in two hash log files (or map shards) of the same window is counted once.
+
+NUM_HASHES = 128  # Length of a signature
+BANDS = 16  # LSH bands of NUM_HASHES / BANDS rows, peers sharing one band are candidates (~0.7 Jaccard)
+JACCARD_THRESHOLD = 0.7  # Minimum estimated Jaccard similarity of a reported pair
+MIN_TRANSACTIONS = 200  # Distinct transactions a peer must have before it is compared (estimated, see estimate_distinct)
+MINHASH_SEED = 20240501  # Fixed, signatures are only mergeable when they use the same hash functions
+HASH_CHUNK = 16  # Hash functions evaluated at once
+
+SIGNATURE_DIRECTORY = "../bitcoin-data/analysis/hashes/minhash_signatures"
+EPOCH = datetime(1970, 1, 1)
+HOUR_US = 3600 * 1000000
+DAY_US = 24 * HOUR_US
+
+HASH_SEEDS = np.random.default_rng(MINHASH_SEED).integers(0, 2 ** 63, NUM_HASHES, dtype=np.uint64)
+EMPTY = np.iinfo(np.uint64).max
+
+def mix(values):
+    # splitmix64 finalizer, a different seed XORed into the input gives an independent hash function
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xbf58476d1ce4e5b9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+def estimate_distinct(signatures):
+    # The minimum of n uniform hashes gives -ln(1 - min) ~ Exp(n), so the NUM_HASHES minima of a signature estimate n
+    # without bias as (NUM_HASHES - 1) / sum, standard error 1 / sqrt(NUM_HASHES - 2) (~9 %). Empty signatures give 0.
+    uniform = signatures.astype(np.float64) / 2.0 ** 64
+    with np.errstate(divide='ignore'):
+        total = -np.log1p(-uniform).sum(axis=1)
+    return (NUM_HASHES - 1) / total
+
+class Signatures:
+    # One signature per (peer, window start), windows of several days can be merged into one
+    def __init__(self):
+        self.index = {}
+        self.keys = []
+        self.signatures = np.full((0, NUM_HASHES), EMPTY, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rows(self, keys):
+        new_keys = [key for key in dict.fromkeys(keys) if key not in self.index]
+        if new_keys:
+            for key in new_keys:
+                self.index[key] = len(self.keys)
+                self.keys.append(key)
+            self.signatures = np.vstack([self.signatures, np.full((len(new_keys), NUM_HASHES), EMPTY, dtype=np.uint64)])
+        return np.array([self.index[key] for key in keys], dtype=np.int64)
+
+    def add(self, keys, signatures):
+        rows = self.rows(keys)
+        # Keys are unique per call, so the fancy-indexed minimum does not lose updates
+        self.signatures[rows] = np.minimum(self.signatures[rows], signatures)
+
+    def merge(self, other):
+        self.add(other.keys, other.signatures)
+
+    def distinct_counts(self):
+        return estimate_distinct(self.signatures)
+
+    def by_peer(self):
+        # Merges all windows of a peer into one signature
+        merged = Signatures()
+        rows = merged.rows([(peer, None) for peer, window_us in self.keys])
+        np.minimum.at(merged.signatures, rows, self.signatures)
+        return merged
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        peers = np.array([peer for peer, window_us in self.keys], dtype=str)
+        windows = np.array([window_us for peer, window_us in self.keys], dtype=np.int64)
+        np.savez(tmp_path, peers=peers, windows=windows, signatures=self.signatures)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        signatures = cls()
+        if os.path.exists(path):
+            with np.load(path) as data:
+                keys = list(zip(data['peers'].tolist(), data['windows'].tolist()))
+                # Files of older versions also hold summed counts, these are not used any more
+                signatures.add(keys, data['signatures'])
+        return signatures
+
+
+def build_signatures(sightings, is_filtered=None, window_us=HOUR_US):
+    # Signatures per day of a (usually single) hash log file, txids are already uniform so 8 bytes are hashed
+    peer_ids, times, txids = sightings.as_numpy()
+    values = np.frombuffer(sightings.txids, dtype=np.uint64).reshape(-1, 4)[:, 0]
+    if is_filtered is not None:
+        filtered = np.array([is_filtered(name) for name in sightings.peers.names], dtype=bool)
+        keep = ~filtered[peer_ids]
+        peer_ids, times, values = peer_ids[keep], times[keep], values[keep]
+
+    windows = times // window_us
+    order = np.lexsort((values, windows, peer_ids))
+    peer_ids, windows, values = peer_ids[order], windows[order], values[order]
+    # A transaction announced again in the same window does not change the signature, it is hashed once
+    distinct = np.r_[True, (peer_ids[1:] != peer_ids[:-1]) | (windows[1:] != windows[:-1]) | (values[1:] != values[:-1])] if len(order) else order.astype(bool)
+    peer_ids, windows, values = peer_ids[distinct], windows[distinct], values[distinct]
+    starts = np.flatnonzero(np.r_[True, (peer_ids[1:] != peer_ids[:-1]) | (windows[1:] != windows[:-1])]) if len(order) else order
+
+    group_signatures = np.empty((len(starts), NUM_HASHES), dtype=np.uint64)
+    for first in range(0, NUM_HASHES, HASH_CHUNK):
+        hashed = mix(values[:, None] ^ HASH_SEEDS[None, first:first + HASH_CHUNK])
+        group_signatures[:, first:first + HASH_CHUNK] = np.minimum.reduceat(hashed, starts, axis=0) if len(starts) else hashed[:0]
+
+    window_starts = windows[starts] * window_us
+    keys = [(sightings.peers.names[peer_id], int(window_start)) for peer_id, window_start in zip(peer_ids[starts], window_starts)]
+    days = window_starts // DAY_US
+
+    day_signatures = {}
+    for day in np.unique(days):
+        in_day = np.flatnonzero(days == day)
+        signatures = Signatures()
+        signatures.add([keys[row] for row in in_day], group_signatures[in_day])
+        day_signatures[(EPOCH + timedelta(days=int(day))).strftime('%Y-%m-%d')] = signatures
+    return day_signatures
+
+def update_signatures(sightings, is_filtered=None, directory=SIGNATURE_DIRECTORY):
+    # Called by hash_analysis for every processed file
+    store_signatures(build_signatures(sightings, is_filtered), directory)
+
+def store_signatures(day_signatures, directory=SIGNATURE_DIRECTORY):
+    os.makedirs(directory, exist_ok=True)
+    for date, signatures in day_signatures.items():
+        path = os.path.join(directory, f"{date}.npz")
+        stored = Signatures.load(path)
+        stored.merge(signatures)
+        stored.save(path)
+
+def find_similar_peers(signatures):
+    # signatures: one signature per peer (see Signatures.by_peer), returns (peer1, peer2, jaccard) sorted by similarity
+    candidates = np.flatnonzero(signatures.distinct_counts() >= MIN_TRANSACTIONS)
+    rows_per_band = NUM_HASHES // BANDS
+    buckets = defaultdict(list)
+    for band in range(BANDS):
+        band_values = signatures.signatures[candidates, band * rows_per_band:(band + 1) * rows_per_band]
+        for row, value in zip(candidates, band_values):
+            buckets[(band, value.tobytes())].append(row)
+
+    candidate_pairs = set()
+    for rows in buckets.values():
+        for i in range(len(rows)):
+            for j in range(i + 1, len(rows)):
+                candidate_pairs.add((rows[i], rows[j]))
+
+    pairs = []
+    for row1, row2 in sorted(candidate_pairs):
+        jaccard = np.mean(signatures.signatures[row1] == signatures.signatures[row2])
+        if jaccard >= JACCARD_THRESHOLD:
+            pairs.append((signatures.keys[row1][0], signatures.keys[row2][0], float(jaccard)))
+    pairs.sort(key=lambda pair: -pair[2])
+    return pairs
+
+def load_days(dates, directory=SIGNATURE_DIRECTORY):
+    merged = Signatures()
+    for date in dates:
+        merged.merge(Signatures.load(os.path.join(directory, f"{date}.npz")).by_peer())
+    return merged
+
+def write_similar_peers(label, pairs, detail_file, suspect_addr_file):
+    for peer1, peer2, jaccard in pairs:
+        suspect_addr_file.write(f"{peer1}; {peer2}\n")
+        detail_file.write(f"Date: {label}\n")
+        detail_file.write(f"Address 1: {peer1}\n")
+        detail_file.write(f"Address 2: {peer2}\n")
+        detail_file.write(f"Estimated Jaccard Similarity: {jaccard:.3f}\n")
+        detail_file.write("=" * 80 + "\n\n")
+
+def main():
+    parser = argparse.ArgumentParser(description='Find peers announcing similar transaction sets')
+    parser.add_argument('--days', type=int, default=1, help='Number of consecutive days merged into one signature per peer')
+    args = parser.parse_args()
+
+    compared_days_file = "../bitcoin-data/analysis/hashes/compared_minhash_days.txt"
+    detail_file_path = "../bitcoin-data/analysis/detail/minhash_analysis_output.log"
+    suspect_addr_file_path = "../bitcoin-data/analysis/suspect_addr/minhash_sus.log"
+
+    compared_days = set()
+    if os.path.exists(compared_days_file):
+        with open(compared_days_file, "r") as f:
+            compared_days = set(f.read().splitlines())
+
+    # The current day is still being written by hash_analysis
+    today = datetime.now().strftime('%Y-%m-%d')
+    all_dates = sorted(f[:-len(".npz")] for f in os.listdir(SIGNATURE_DIRECTORY) if f.endswith(".npz") and not f.endswith(".tmp.npz"))
+    all_dates = [date for date in all_dates if date < today]
+
+    with open(detail_file_path, "a") as detail_file, open(suspect_addr_file_path, "a") as suspect_addr_file:
+        for position in range(args.days - 1, len(all_dates)):
+            dates = all_dates[position - args.days + 1:position + 1]
+            label = dates[-1] if args.days == 1 else f"{dates[0]} - {dates[-1]}"
+            if label in compared_days:
+                continue
+
+            signatures = load_days(dates)
+            pairs = find_similar_peers(signatures)
+            write_similar_peers(label, pairs, detail_file, suspect_addr_file)
+            print(f"{label}: {len(signatures)} peers, {len(pairs)} similar transaction sets")
+
+            with open(compared_days_file, "a") as f:
+                f.write(label + "\n")
+
+if __name__ == "__main__":
+    main()
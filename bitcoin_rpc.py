@@ -0,0 +1,157 @@
+import os
+import json
+import base64
+import queue
+import threading
+import http.client
+
+# Connection settings, can be overridden by environment variables
+RPC_HOST = os.environ.get('BITCOIN_RPC_HOST', '127.0.0.1')
+RPC_PORT = int(os.environ.get('BITCOIN_RPC_PORT', '8332'))
+RPC_USER = os.environ.get('BITCOIN_RPC_USER')
+RPC_PASSWORD = os.environ.get('BITCOIN_RPC_PASSWORD')
+DATADIR = os.environ.get('BITCOIN_DATADIR', os.path.expanduser('~/.bitcoin'))
+POOL_SIZE = 8
+TIMEOUT = 60
+BATCH_SIZE = 1000
+
+
+class RPCError(Exception):
+    def __init__(self, method, error):
+        self.method = method
+        self.code = error.get('code') if isinstance(error, dict) else None
+        self.message = error.get('message') if isinstance(error, dict) else str(error)
+        super().__init__(f"{method}: {self.message} (code {self.code})")
+
+
+def read_cookie(datadir):
+    with open(os.path.join(datadir, '.cookie'), 'r') as file:
+        return file.read().strip()
+
+
+class RPCClient:
+    def __init__(self, host=RPC_HOST, port=RPC_PORT, user=RPC_USER, password=RPC_PASSWORD,
+                 datadir=DATADIR, pool_size=POOL_SIZE, timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.datadir = datadir
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+        self.next_id = 0
+        self.id_lock = threading.Lock()
+        self.auth_header = self.make_auth_header()
+
+    def make_auth_header(self):
+        if self.user is not None and self.password is not None:
+            credentials = f"{self.user}:{self.password}"
+        else:
+            # bitcoind writes a new cookie on every start
+            credentials = read_cookie(self.datadir)
+        return 'Basic ' + base64.b64encode(credentials.encode()).decode()
+
+    def get_connection(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def release_connection(self, connection):
+        try:
+            self.pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def new_id(self):
+        with self.id_lock:
+            self.next_id += 1
+            return self.next_id
+
+    def post(self, payload):
+        body = json.dumps(payload).encode()
+        # A pooled keep-alive connection may have been closed by bitcoind in the meantime, retry once on a fresh one
+        for attempt in range(2):
+            connection = self.get_connection()
+            try:
+                connection.request('POST', '/', body, {
+                    'Authorization': self.auth_header,
+                    'Content-Type': 'application/json',
+                    'Connection': 'keep-alive'
+                })
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                if attempt == 1:
+                    raise
+                continue
+
+            if response.status == 401 and attempt == 0:
+                connection.close()
+                self.auth_header = self.make_auth_header()
+                continue
+
+            if response.will_close:
+                connection.close()
+            else:
+                self.release_connection(connection)
+
+            # bitcoind answers RPC errors with a JSON body and a 404/500 status
+            if not data:
+                raise RPCError('http', {'code': response.status, 'message': response.reason})
+            return json.loads(data)
+
+    def call(self, method, *params):
+        response = self.post({'jsonrpc': '1.0', 'id': self.new_id(), 'method': method, 'params': list(params)})
+        if response.get('error') is not None:
+            raise RPCError(method, response['error'])
+        return response['result']
+
+    def batch(self, calls, batch_size=BATCH_SIZE):
+        # calls is a list of (method, params) tuples, returns results in the same order.
+        # Failed calls are returned as RPCError instances instead of raising, so one bad entry does not abort the batch.
+        results = []
+        for start in range(0, len(calls), batch_size):
+            chunk = calls[start:start + batch_size]
+            requests = []
+            for method, params in chunk:
+                requests.append({'jsonrpc': '1.0', 'id': self.new_id(), 'method': method, 'params': list(params)})
+            responses = self.post(requests)
+            if isinstance(responses, dict):
+                raise RPCError('batch', responses.get('error') or responses)
+
+            by_id = {response['id']: response for response in responses}
+            for request in requests:
+                response = by_id.get(request['id'])
+                if response is None:
+                    results.append(RPCError(request['method'], {'code': None, 'message': 'missing response'}))
+                elif response.get('error') is not None:
+                    results.append(RPCError(request['method'], response['error']))
+                else:
+                    results.append(response['result'])
+        return results
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = RPCClient()
+        return _client
+
+def call(method, *params):
+    return get_client().call(method, *params)
+
+def batch(calls, batch_size=BATCH_SIZE):
+    return get_client().batch(calls, batch_size)
@@ -0,0 +1,174 @@
+import os
+import json
+import dbm
+from datetime import datetime
+
+# Field-level change log of getpeerinfo states, one JSON Lines file per day in change_log_folder.
+# Addresses are interned once in peers.jsonl ({"id", "addr"}), the daily records reference the id:
+#   {"t": time, "p": id, "c": {...}}                                          checkpoint, full state of the peer
+#   {"t": time, "p": id, "d": [[key, old, new], ...], "r": [[key, old], ...]}  delta, changed and removed fields
+# Before the first delta of a peer on a day, and then every CHECKPOINT_INTERVAL deltas, a checkpoint of the
+# state before the delta is written, so a peer's state is rebuilt from a single day file.
+
+change_log_folder = '../bitcoin-data/analysis/change_log'
+date_format = "%d-%m-%Y"
+CHECKPOINT_INTERVAL = 50  # Deltas of a peer between two checkpoints
+BUFFER_SIZE = 256  # Records collected before they are written in one go
+
+NEXT_ID_KEY = '#next_id'
+
+def get_log_path(date, folder=change_log_folder):
+    return os.path.join(folder, f"{date}.jsonl")
+
+def get_peers_path(folder=change_log_folder):
+    return os.path.join(folder, "peers.jsonl")
+
+def diff_fields(old, new):
+    changed = [[key, old.get(key), value] for key, value in new.items() if key not in old or old[key] != value]
+    removed = [[key, value] for key, value in old.items() if key not in new]
+    return changed, removed
+
+def apply_delta(state, record):
+    for key, old, new in record.get('d', []):
+        state[key] = new
+    for key, old in record.get('r', []):
+        state.pop(key, None)
+
+
+class ChangeLogWriter:
+    def __init__(self, folder=change_log_folder):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        # addr -> {"id", "day" of the last checkpoint, "deltas" since}
+        self.peers = dbm.open(os.path.join(folder, "peers"), 'c')
+        self.pending_peers = {}
+        self.new_peer_lines = []
+        self.buffer = []
+
+    def peer_state(self, addr):
+        if addr in self.pending_peers:
+            return self.pending_peers[addr]
+        if addr in self.peers:
+            return json.loads(self.peers[addr])
+        next_id = int(self.peers.get(NEXT_ID_KEY, b'0')) + len(self.new_peer_lines)
+        self.new_peer_lines.append(json.dumps({'id': next_id, 'addr': addr}) + '\n')
+        return {'id': next_id, 'day': None, 'deltas': 0}
+
+    def record(self, addr, time, old, new):
+        changed, removed = diff_fields(old, new)
+        if not changed and not removed:
+            return
+        state = self.peer_state(addr)
+        date = time.strftime(date_format)
+        timestamp = time.isoformat()
+
+        if state['day'] != date or state['deltas'] >= CHECKPOINT_INTERVAL:
+            self.buffer.append((date, {'t': timestamp, 'p': state['id'], 'c': old}))
+            state = {'id': state['id'], 'day': date, 'deltas': 0}
+        delta = {'t': timestamp, 'p': state['id'], 'd': changed}
+        if removed:
+            delta['r'] = removed
+        self.buffer.append((date, delta))
+        state['deltas'] += 1
+        self.pending_peers[addr] = state
+
+        if len(self.buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        # Addresses are written before the records that use them, the peer states after them
+        if self.new_peer_lines:
+            with open(get_peers_path(self.folder), 'a') as file:
+                file.write(''.join(self.new_peer_lines))
+            self.peers[NEXT_ID_KEY] = str(int(self.peers.get(NEXT_ID_KEY, b'0')) + len(self.new_peer_lines))
+            self.new_peer_lines = []
+
+        lines_by_date = {}
+        for date, record in self.buffer:
+            lines_by_date.setdefault(date, []).append(json.dumps(record, separators=(',', ':')) + '\n')
+        for date, lines in lines_by_date.items():
+            with open(get_log_path(date, self.folder), 'a') as file:
+                file.write(''.join(lines))
+        self.buffer = []
+
+        for addr, state in self.pending_peers.items():
+            self.peers[addr] = json.dumps(state)
+        self.pending_peers = {}
+
+    def close(self):
+        self.flush()
+        self.peers.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_addresses(folder=change_log_folder):
+    addresses = {}
+    if os.path.exists(get_peers_path(folder)):
+        with open(get_peers_path(folder), 'r') as file:
+            for line in file:
+                if line.strip():
+                    peer = json.loads(line)
+                    addresses[peer['id']] = peer['addr']
+    return addresses
+
+def list_dates(folder=change_log_folder):
+    dates = [filename[:-len('.jsonl')] for filename in os.listdir(folder) if filename.endswith('.jsonl') and filename != "peers.jsonl"]
+    return sorted(dates, key=lambda date: datetime.strptime(date, date_format))
+
+def iter_records(date, folder=change_log_folder, addresses=None):
+    # Records of a day with the address resolved as 'addr'
+    addresses = addresses if addresses is not None else load_addresses(folder)
+    with open(get_log_path(date, folder), 'r') as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                record['addr'] = addresses.get(record['p'])
+                yield record
+
+def iter_changes(folder=change_log_folder, addr=None):
+    # (time, addr, key, old, new) of every changed field, new is None for removed fields
+    addresses = load_addresses(folder)
+    for date in list_dates(folder):
+        for record in iter_records(date, folder, addresses):
+            if 'd' not in record or (addr is not None and record['addr'] != addr):
+                continue
+            for key, old, new in record['d']:
+                yield record['t'], record['addr'], key, old, new
+            for key, old in record.get('r', []):
+                yield record['t'], record['addr'], key, old, None
+
+def get_state_at(addr, time, folder=change_log_folder):
+    # Full state of a peer after all changes up to `time`, None if nothing was recorded before
+    addresses = load_addresses(folder)
+    timestamp = time.isoformat()
+    for date in reversed(list_dates(folder)):
+        if datetime.strptime(date, date_format).date() > time.date():
+            continue
+        state = None
+        for record in iter_records(date, folder, addresses):
+            if record['addr'] != addr or record['t'] > timestamp:
+                continue
+            if 'c' in record:
+                state = dict(record['c'])
+            if 'd' in record and state is not None:
+                apply_delta(state, record)
+        if state is not None:
+            return state
+    return None
+
+def get_latest_states(folder=change_log_folder):
+    # addr -> last state of every peer in the change log
+    addresses = load_addresses(folder)
+    states = {}
+    for date in list_dates(folder):
+        for record in iter_records(date, folder, addresses):
+            if 'c' in record:
+                states[record['addr']] = dict(record['c'])
+            if 'd' in record and record['addr'] in states:
+                apply_delta(states[record['addr']], record)
+    return states
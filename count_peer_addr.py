@@ -1,78 +1,143 @@
 import os
-import re
-import subprocess
+import json
+from datetime import datetime, timedelta
 import filterPeers
+import peer_store
 
-def run_filter_peers(date):
-    ipv4_path = "../bitcoin-data/daily_ipv4"
-    ipv6_path = "../bitcoin-data/daily_ipv6"
-    onion_path = "../bitcoin-data/daily_onion"
-
-    # Validate the date format
-    if not validate_date_format(date):
-        print("Invalid date format.")
-        return
-
-    # Open the folders and get the addresses
-    ipv4_addresses_with_port, ipv4_addresses_without_port = get_addresses(ipv4_path, date)
-    ipv6_addresses_with_port, ipv6_addresses_without_port = get_addresses(ipv6_path, date)
-    onion_addresses_with_port, onion_addresses_without_port = get_addresses(onion_path, date)
-
-    # Print the number of addresses with the port
-    print(f"Number of IPv4 addresses (with port): {len(ipv4_addresses_with_port)}")
-    print(f"Number of IPv6 addresses (with port): {len(ipv6_addresses_with_port)}")
-    print(f"Number of Onion addresses (with port): {len(onion_addresses_with_port)}")
-
-    # Print the number of addresses without the port
-    print(f"Number of IPv4 addresses (without port): {len(ipv4_addresses_without_port)}")
-    print(f"Number of IPv6 addresses (without port): {len(ipv6_addresses_without_port)}")
-    print(f"Number of Onion addresses (without port): {len(onion_addresses_without_port)}")
+data_root = "../bitcoin-data"
+offsets_path = os.path.join(data_root, "daily_summary_offsets.json")
+NETWORK_LABELS = {'ipv4': 'IPv4', 'ipv6': 'IPv6', 'onion': 'Onion', 'i2p': 'I2P', 'cjdns': 'CJDNS'}
 
+# Queries are answered from daily_summary/<date>.json. Days stored as JSON Lines are brought up to date by reading
+# only the peers appended after the offset saved in daily_summary_offsets.json, the summary holds sets of addresses,
+# so peers that are already in it (e.g. from a split by filterPeers) can be read again without changing it.
 
 def validate_date_format(date):
     # Validate the date format
     try:
-        day, month, year = date.split('-')
-        int(day)
-        int(month)
-        int(year)
+        datetime.strptime(date, "%d-%m-%Y")
         return True
     except ValueError:
         return False
 
+def build_summary_from_files(date):
+    # Days split before the summary index existed are summarized once from their per-network files
+    partitions = {}
+    for network in filterPeers.NETWORKS:
+        file_path = os.path.join(data_root, f"daily_{network}", f"{date}.json")
+        if os.path.isfile(file_path):
+            with open(file_path, 'r') as file:
+                partitions[network] = json.load(file)
+        else:
+            partitions[network] = []
+    if not any(partitions.values()):
+        return None
+    summary = filterPeers.build_summary(partitions)
+    filterPeers.write_summary(date, summary, data_root)
+    return summary
+
+def load_offsets():
+    if os.path.isfile(offsets_path):
+        with open(offsets_path, 'r') as file:
+            return json.load(file)
+    return {}
+
+def save_offsets(offsets):
+    with open(offsets_path + '.tmp', 'w') as file:
+        json.dump(offsets, file, indent=4)
+    os.replace(offsets_path + '.tmp', offsets_path)
+
+def read_appended_peers(jsonl_path, offset):
+    # Peers of the complete lines after offset and the offset behind the last of them
+    peers = []
+    with open(jsonl_path, 'rb') as file:
+        file.seek(offset)
+        for line in file:
+            if not line.endswith(b'\n'):
+                break  # Still being written
+            if line.strip():
+                peers.append(json.loads(line))
+            offset += len(line)
+    return peers, offset
+
+def extend_summary(summary, peers):
+    addresses = {network: set((summary or {}).get(network, {}).get('addresses', [])) for network in filterPeers.NETWORKS}
+    for peer in peers:
+        network = filterPeers.get_peer_network(peer)
+        if network is not None and 'addr' in peer:
+            addresses[network].add(peer['addr'])
+    return filterPeers.build_summary({network: [{'addr': addr} for addr in network_addresses]
+                                      for network, network_addresses in addresses.items()})
+
+def read_summary(date):
+    summary_path = filterPeers.get_summary_path(date, data_root)
+    if os.path.isfile(summary_path):
+        with open(summary_path, 'r') as file:
+            return json.load(file)
+    return None
+
+def load_summary(date, offsets):
+    summary = read_summary(date)
+    jsonl_path = peer_store.get_jsonl_path(date)
+    if not os.path.isfile(jsonl_path):
+        return summary if summary is not None else build_summary_from_files(date)
+
+    offset = offsets.get(date, 0) if summary is not None else 0
+    size = os.path.getsize(jsonl_path)
+    if offset > size:
+        summary, offset = None, 0  # The day was stored again
+    if offset < size:
+        peers, offsets[date] = read_appended_peers(jsonl_path, offset)
+        if peers or summary is None:
+            summary = extend_summary(summary, peers)
+            filterPeers.write_summary(date, summary, data_root)
+    return summary if any(network['addresses'] for network in summary.values()) else None
+
+def get_dates(start_date, end_date):
+    start = datetime.strptime(start_date, "%d-%m-%Y")
+    end = datetime.strptime(end_date, "%d-%m-%Y")
+    return [(start + timedelta(days=offset)).strftime("%d-%m-%Y") for offset in range((end - start).days + 1)]
+
+def run_filter_peers(start_date, end_date=None):
+    end_date = end_date or start_date
 
-def extract_address_without_port(addr_with_port):
-    # Extract address without the port
-    return addr_with_port.split(':')[0]
-
-
-def get_addresses(folder_path, date):
-    addresses_with_port = []
-    addresses_without_port = []
-    file_path = os.path.join(folder_path, f"{date}.json")
+    # Validate the date format
+    if not validate_date_format(start_date) or not validate_date_format(end_date):
+        print("Invalid date format.")
+        return
 
-    if not os.path.isfile(file_path):
-        print(f"File {file_path} not found.")
-        return addresses_with_port, addresses_without_port
+    # Distinct addresses and hosts of all days in the range
+    addresses = {network: set() for network in filterPeers.NETWORKS}
+    hosts = {network: set() for network in filterPeers.NETWORKS}
+    offsets = load_offsets()
+    for date in get_dates(start_date, end_date):
+        summary = load_summary(date, offsets)
+        if summary is None:
+            print(f"No peers found for {date}.")
+            continue
+        for network, network_summary in summary.items():
+            addresses[network].update(network_summary['addresses'])
+            hosts[network].update(network_summary['hosts'])
+    save_offsets(offsets)
 
-    # Read the file and extract the "addr" field using regular expressions
-    with open(file_path, 'r') as file:
-        for line in file:
-            addr_matches = re.findall(r'"addr":\s*"(.+?)"', line)
-            for addr_match in addr_matches:
-                addresses_with_port.append(addr_match)
-                address_without_port = extract_address_without_port(addr_match)
-                if address_without_port not in addresses_without_port:
-                    addresses_without_port.append(address_without_port)
+    # Print the number of addresses with the port
+    for network, label in NETWORK_LABELS.items():
+        print(f"Number of {label} addresses (with port): {len(addresses[network])}")
 
-    return addresses_with_port, addresses_without_port
+    # Print the number of addresses without the port
+    for network, label in NETWORK_LABELS.items():
+        print(f"Number of {label} addresses (without port): {len(hosts[network])}")
 
 
 if __name__ == "__main__":
     while True:
-        date = input("Enter the date (format: Day-Month-Year): ")
+        date = input("Enter the date or a range (format: Day-Month-Year [Day-Month-Year]): ")
         if "quit" not in date:
-            run_filter_peers(date)
+            dates = date.split()
+            if dates:
+                run_filter_peers(*dates[:2])
+            else:
+                print("Invalid date format.")
             print(f"----------------------------")
         else:
             break
@@ -1,29 +1,76 @@
 import os
-import shutil
-import datetime
+import time
+import signal
+import segment_writer
+
+# The hash producer writes incoming_hashes.log itself. The live file is renamed to a staging file, so a rotation
+# never copies or truncates it and no line gets lost: the producer keeps appending to the renamed file until it
+# reopens its log path. It is told to do so with REOPEN_SIGNAL if its pid file is configured, producers that open
+# the path for every write or watch its inode (like logging.handlers.WatchedFileHandler) reopen on their own.
+# The staging file is sealed only once a new log file exists and the staging file stopped growing, until then no
+# further rotation happens. Producers that write to stdout can pipe into segment_writer.py and need no rotation.
+
+REOPEN_SIGNAL = signal.SIGHUP
+REOPEN_TIMEOUT = 30  # Seconds to wait for the producer to reopen its log, afterwards the next run checks again
+STABLE_TIME = 2  # Seconds the staging file must not grow before it is sealed
+POLL_INTERVAL = 0.5
+
+def signal_producer(pid_file):
+    if pid_file is None:
+        return
+    try:
+        with open(pid_file, 'r') as file:
+            os.kill(int(file.read().strip()), REOPEN_SIGNAL)
+    except (OSError, ValueError) as e:
+        print(f"Could not signal the hash producer: {e}")
+
+def producer_reopened(log_file_path, staging_path):
+    # True once the producer writes to a new file at the log path and no longer to the staging file
+    if not os.path.exists(log_file_path) or os.stat(log_file_path).st_ino == os.stat(staging_path).st_ino:
+        return False
+    size = os.path.getsize(staging_path)
+    time.sleep(STABLE_TIME)
+    return os.path.getsize(staging_path) == size
+
+def wait_for_reopen(log_file_path, staging_path, timeout=REOPEN_TIMEOUT):
+    deadline = time.time() + timeout
+    while not producer_reopened(log_file_path, staging_path):
+        if time.time() >= deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+    return True
 
 def main():
     log_file_path = '../bitcoin-data/hashes/incoming_hashes.log'
     save_folder = '../bitcoin-data/hashes/hash_saves'
+    staging_path = os.path.join(save_folder, '.staged_incoming_hashes.log')
+    producer_pid_file = None  # Pid file of the hash producer, it gets REOPEN_SIGNAL after a rotation
     max_file_size_mb = 30
+    compression = None  # None, 'gzip' or 'zstd'
 
-    if not os.path.exists(save_folder):
-        os.mkdir(save_folder)
+    writer = segment_writer.SegmentWriter(save_folder, "_incoming_hashes.log", compression=compression)
 
-    file_size_mb = os.path.getsize(log_file_path) / (1024 * 1024)
+    # Staged by an earlier run whose producer had not reopened its log yet
+    if os.path.exists(staging_path):
+        if not wait_for_reopen(log_file_path, staging_path, timeout=0):
+            print(f"The hash producer still writes to {staging_path}, it is sealed once the producer reopened its log.")
+            writer.close()
+            return
+        writer.seal_file(staging_path)
+        print(f"Staged file sealed in {save_folder}.")
 
-    if file_size_mb > max_file_size_mb:
-        now = datetime.datetime.now()
-        timestamp = now.strftime('%Y-%m-%d_%H-%M-%S')
-        new_file_name = f"{timestamp}_incoming_hashes.log"
-
-        destination_path = os.path.join(save_folder, new_file_name)
+    file_size_mb = os.path.getsize(log_file_path) / (1024 * 1024) if os.path.exists(log_file_path) else 0
 
-        shutil.copy(log_file_path, destination_path)
-
-        open(log_file_path, 'w').close()
+    if file_size_mb > max_file_size_mb:
+        os.rename(log_file_path, staging_path)
+        signal_producer(producer_pid_file)
+        if wait_for_reopen(log_file_path, staging_path):
+            writer.seal_file(staging_path)
+            print(f"File sealed in {save_folder}.")
+        else:
+            print(f"File staged in {staging_path}, it is sealed once the producer reopened its log.")
 
-        print(f"File saved in {destination_path}.")
+    writer.close()
 
 if __name__ == "__main__":
     main()
@@ -1,29 +1,21 @@
 import os
-import shutil
-import datetime
+import segment_writer
+
+# heartbeat.py writes its log segments to pinglogs directly. A heartbeat.log of the old heartbeat is moved over
+# by rename as one more segment, so it shows up in the manifest for heartbeat_analysis.
 
 def main():
     log_file_path = '../bitcoin-data/analysis/ping/heartbeat.log'
     save_folder = '../bitcoin-data/analysis/ping/pinglogs'
-    max_file_size_mb = 30
-
-    if not os.path.exists(save_folder):
-        os.mkdir(save_folder)
-
-    file_size_mb = os.path.getsize(log_file_path) / (1024 * 1024)
-
-    if file_size_mb > max_file_size_mb:
-        now = datetime.datetime.now()
-        timestamp = now.strftime('%Y-%m-%d_%H-%M-%S')
-        new_file_name = f"{timestamp}_ping_anomaly.log"
-
-        destination_path = os.path.join(save_folder, new_file_name)
+    compression = None  # None, 'gzip' or 'zstd'
 
-        shutil.copy(log_file_path, destination_path)
+    writer = segment_writer.SegmentWriter(save_folder, "_ping_anomaly.log", compression=compression)
 
-        open(log_file_path, 'w').close()
+    if os.path.exists(log_file_path) and os.path.getsize(log_file_path) > 0:
+        writer.seal_file(log_file_path)
+        print(f"File saved in {save_folder}.")
 
-        print(f"File saved in {destination_path}.")
+    writer.close()
 
 if __name__ == "__main__":
     main()
@@ -1,52 +1,113 @@
 import os
-import json
 import re
+import json
+import sqlite3
+from datetime import datetime
+import peer_store
 
 data_directory = "../bitcoin-data/daily_json_files/"
 output_file = "../bitcoin-data/seen_addresses.txt"
+registry_file = "../bitcoin-data/seen_addresses.sqlite"
 
-if os.path.exists(output_file):
-    os.remove(output_file)
-
-onion_addresses = set()
-ipv4_addresses = set()
-ipv6_addresses = set()
+# Registry of all addresses seen in the daily files with the first and last day they were seen. Every source file
+# has a watermark (size, mtime and for JSON Lines the byte offset already read), so a run only reads new data.
+# seen_addresses.txt lists onion addresses, then addresses containing a dot (IPv4), then the rest (IPv6),
+# each sorted, and is streamed from the (category, addr) index.
 
+ONION, IPV4, IPV6 = 0, 1, 2
 onion_regex = r"^(.*\.onion)(:\d+)?$"
 
-for filename in os.listdir(data_directory):
-    if filename.endswith(".json"):
-        file_path = os.path.join(data_directory, filename)
-        with open(file_path, "r") as file:
-            try:
-                json_data = json.load(file)
-                for entry in json_data:
-                    if "addr" in entry:
-                        address = entry["addr"]
-                        match = re.match(onion_regex, address)
-                        if match:
-                            onion_address = match.group(1)
-                            port = match.group(2)
-                            onion_addresses.add(address)
-                        elif "." in address:
-                            ipv4_addresses.add(address)
-                        else:
-                            ipv6_addresses.add(address)
-            except json.JSONDecodeError:
-                print(f"Error decoding JSON in file: {file_path}")
-
-onion_addresses = sorted(onion_addresses)
-ipv4_addresses = sorted(ipv4_addresses)
-ipv6_addresses = sorted(ipv6_addresses)
-
-with open(output_file, "w") as output:
-    for address in onion_addresses:
-        output.write(address + "\n")
-
-    for address in ipv4_addresses:
-        output.write(address + "\n")
-
-    for address in ipv6_addresses:
-        output.write(address + "\n")
-
-print("Address extraction complete.")
+def get_category(address):
+    if re.match(onion_regex, address):
+        return ONION
+    if "." in address:
+        return IPV4
+    return IPV6
+
+def open_registry(path=registry_file):
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS addresses ("
+        "addr TEXT PRIMARY KEY, category INTEGER NOT NULL, first_seen TEXT NOT NULL, last_seen TEXT NOT NULL)"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS addresses_sorted ON addresses (category, addr)")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS sources (file TEXT PRIMARY KEY, size INTEGER, mtime REAL, offset INTEGER)"
+    )
+    return connection
+
+def get_watermark(connection, file_name):
+    return connection.execute("SELECT size, mtime, offset FROM sources WHERE file = ?", (file_name,)).fetchone()
+
+def get_source_path(date):
+    jsonl_path = peer_store.get_jsonl_path(date, data_directory)
+    return jsonl_path if os.path.exists(jsonl_path) else peer_store.get_json_path(date, data_directory)
+
+def read_new_peers(path, watermark):
+    # Returns the peers added to a file since the watermark and the new watermark, None if nothing changed
+    stat = os.stat(path)
+    if watermark is not None and watermark[0] == stat.st_size and watermark[1] == stat.st_mtime:
+        return None, None
+
+    if not path.endswith(".jsonl"):
+        return peer_store.read_legacy_json(path), (stat.st_size, stat.st_mtime, stat.st_size)
+
+    # JSON Lines files only grow, a smaller file is read again from the start
+    offset = watermark[2] if watermark is not None and watermark[2] <= stat.st_size else 0
+    peers = []
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        for line in file:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            if line.strip():
+                peers.append(json.loads(line))
+    return peers, (stat.st_size, stat.st_mtime, offset)
+
+def update_registry(connection):
+    updated_days = 0
+    for date in peer_store.list_dates(data_directory):
+        iso_date = datetime.strptime(date, peer_store.date_format).strftime("%Y-%m-%d")
+        path = get_source_path(date)
+        file_name = os.path.basename(path)
+        try:
+            peers, new_watermark = read_new_peers(path, get_watermark(connection, file_name))
+        except json.JSONDecodeError:
+            print(f"Error decoding JSON for date: {date}")
+            continue
+        if peers is None:
+            continue
+
+        rows = [(entry["addr"], get_category(entry["addr"]), iso_date, iso_date) for entry in peers if "addr" in entry]
+        connection.executemany(
+            "INSERT INTO addresses VALUES (?, ?, ?, ?) ON CONFLICT (addr) DO UPDATE SET "
+            "first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen)",
+            rows
+        )
+        connection.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)", (file_name, *new_watermark))
+        connection.commit()
+        updated_days += 1
+    return updated_days
+
+def write_seen_addresses(connection, path=output_file):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as output:
+        for (address,) in connection.execute("SELECT addr FROM addresses ORDER BY category, addr"):
+            output.write(address + "\n")
+    os.replace(temp_path, path)
+
+def get_seen_dates(connection, address):
+    # (first_seen, last_seen) as YYYY-MM-DD, None for unknown addresses
+    return connection.execute("SELECT first_seen, last_seen FROM addresses WHERE addr = ?", (address,)).fetchone()
+
+def main():
+    connection = open_registry()
+    updated_days = update_registry(connection)
+    if updated_days or not os.path.exists(output_file):
+        write_seen_addresses(connection)
+    connection.close()
+    print(f"Address extraction complete ({updated_days} days updated).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import sys
+import json
+import time
+import random
+import base64
+import hashlib
+import threading
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bitcoin_rpc
+
+# Minimal JSON-RPC server that answers the calls used by the collectors with generated data.
+# Used to try out the scripts and to benchmark bitcoin_rpc without a running node.
+
+RPC_USER = 'fake'
+RPC_PASSWORD = 'fake'
+RPC_METHODS = ('getpeerinfo', 'ping', 'getrawmempool', 'getmempoolentry', 'getnodeaddresses', 'addnode')
+
+
+def make_txid(n):
+    return hashlib.sha256(str(n).encode()).hexdigest()
+
+def make_address(n, network):
+    if network == 'ipv4':
+        return f"{10 + n % 200}.{(n // 200) % 256}.{(n // 51200) % 256}.{n % 250 + 1}:8333"
+    if network == 'ipv6':
+        return f"[2001:db8::{n:x}]:8333"
+    if network == 'onion':
+        return f"{hashlib.sha256(str(n).encode()).hexdigest()[:56]}.onion:8333"
+    return f"{hashlib.sha256(str(n).encode()).hexdigest()[:52]}.b32.i2p:0"
+
+
+class FakeNode:
+    def __init__(self, peers=125, mempool_size=5000, node_addresses=80000, seed=0):
+        self.random = random.Random(seed)
+        self.networks = ['ipv4', 'ipv6', 'onion', 'i2p']
+        self.peers = [self.make_peer(n) for n in range(peers)]
+        self.mempool = {make_txid(n): self.make_mempool_entry(n) for n in range(mempool_size)}
+        self.node_addresses = node_addresses
+        self.added_nodes = []
+        self.lock = threading.Lock()
+        self.next_tx = mempool_size
+
+    def make_peer(self, n):
+        network = self.networks[n % 3]
+        pingtime = round(self.random.uniform(0.02, 0.5), 6)
+        return {
+            'id': n,
+            'addr': make_address(n, network),
+            'network': network,
+            'services': '0000000000000409',
+            'relaytxes': True,
+            'lastsend': int(time.time()),
+            'lastrecv': int(time.time()),
+            'bytessent': self.random.randint(1000, 10 ** 7),
+            'bytesrecv': self.random.randint(1000, 10 ** 7),
+            'conntime': int(time.time()) - self.random.randint(0, 86400),
+            'timeoffset': 0,
+            'pingtime': pingtime,
+            'minping': pingtime,
+            'version': 70016,
+            'subver': self.random.choice(['/Satoshi:25.0.0/', '/Satoshi:24.0.1/', '/Satoshi:23.0.0/']),
+            'inbound': n % 2 == 0,
+            'startingheight': 800000,
+            'synced_headers': 800000,
+            'synced_blocks': 800000,
+            'connection_type': 'inbound' if n % 2 == 0 else 'outbound-full-relay'
+        }
+
+    def make_mempool_entry(self, n):
+        return {
+            'vsize': self.random.randint(100, 1000),
+            'weight': self.random.randint(400, 4000),
+            'time': int(time.time()),
+            'height': 800000,
+            'descendantcount': 1,
+            'ancestorcount': 1,
+            'fees': {'base': 0.00001, 'modified': 0.00001, 'ancestor': 0.00001, 'descendant': 0.00001},
+            'depends': [],
+            'spentby': [],
+            'bip125-replaceable': False,
+            'unbroadcast': False
+        }
+
+    def tick(self):
+        # Let the node state drift a little between calls
+        with self.lock:
+            for peer in self.peers:
+                peer['pingtime'] = round(max(0.001, peer['pingtime'] * self.random.uniform(0.8, 1.2)), 6)
+                peer['minping'] = min(peer['minping'], peer['pingtime'])
+                peer['bytesrecv'] += self.random.randint(0, 5000)
+            for txid in list(self.mempool)[:len(self.mempool) // 20]:
+                del self.mempool[txid]
+            for _ in range(len(self.mempool) // 20 + 1):
+                self.mempool[make_txid(self.next_tx)] = self.make_mempool_entry(self.next_tx)
+                self.next_tx += 1
+
+    def getpeerinfo(self):
+        with self.lock:
+            return json.loads(json.dumps(self.peers))
+
+    def ping(self):
+        self.tick()
+        return None
+
+    def getrawmempool(self, verbose=False, mempool_sequence=False):
+        with self.lock:
+            if verbose:
+                return dict(self.mempool)
+            return list(self.mempool)
+
+    def getmempoolentry(self, txid):
+        with self.lock:
+            if txid not in self.mempool:
+                raise KeyError('Transaction not in mempool')
+            return self.mempool[txid]
+
+    def getnodeaddresses(self, count=1, network=None):
+        addresses = []
+        for n in range(min(count, self.node_addresses)):
+            address_network = self.networks[n % 4]
+            if network is not None and address_network != network:
+                continue
+            address, port = make_address(n, address_network).rsplit(':', 1)
+            addresses.append({
+                'time': int(time.time()),
+                'services': 1033,
+                'address': address.strip('[]'),
+                'port': int(port),
+                'network': address_network
+            })
+        return addresses
+
+    def addnode(self, node, command):
+        if command not in ('add', 'remove', 'onetry'):
+            raise ValueError('Error: Invalid command')
+        with self.lock:
+            self.added_nodes.append(node)
+        return None
+
+
+class FakeBitcoindHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, request):
+        method = request.get('method')
+        params = request.get('params') or []
+        if method not in RPC_METHODS:
+            return {'result': None, 'error': {'code': -32601, 'message': 'Method not found'}, 'id': request.get('id')}
+        try:
+            return {'result': getattr(self.server.node, method)(*params), 'error': None, 'id': request.get('id')}
+        except Exception as e:
+            return {'result': None, 'error': {'code': -1, 'message': str(e)}, 'id': request.get('id')}
+
+    def do_POST(self):
+        expected = 'Basic ' + base64.b64encode(f"{RPC_USER}:{RPC_PASSWORD}".encode()).decode()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Authorization') != expected:
+            self.send_response(401)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        request = json.loads(body)
+        if isinstance(request, list):
+            self.send_json(200, [self.handle_request(entry) for entry in request])
+        else:
+            response = self.handle_request(request)
+            self.send_json(200 if response['error'] is None else 500, response)
+
+
+def start_fake_bitcoind(port=0, node=None):
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeBitcoindHandler)
+    server.daemon_threads = True
+    server.node = node or FakeNode()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def make_client(server, pool_size=bitcoin_rpc.POOL_SIZE):
+    host, port = server.server_address
+    return bitcoin_rpc.RPCClient(host, port, RPC_USER, RPC_PASSWORD, pool_size=pool_size)
+
+def benchmark(calls):
+    server = start_fake_bitcoind()
+    client = make_client(server)
+
+    start = time.perf_counter()
+    for n in range(calls):
+        client.call('getmempoolentry', make_txid(n % 1000))
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    client.batch([('getmempoolentry', [make_txid(n % 1000)]) for n in range(calls)])
+    batched = time.perf_counter() - start
+
+    print(f"{calls} calls over one keep-alive connection: {sequential:.3f}s ({calls / sequential:.0f} calls/s)")
+    print(f"{calls} calls as JSON-RPC batch: {batched:.3f}s ({calls / batched:.0f} calls/s)")
+
+    client.close()
+    server.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake bitcoind JSON-RPC server')
+    parser.add_argument('--port', type=int, default=18443)
+    parser.add_argument('--benchmark', type=int, metavar='CALLS', help='Run a client benchmark and exit')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return
+
+    server = start_fake_bitcoind(args.port)
+    print(f"Fake bitcoind listening on 127.0.0.1:{args.port} (user {RPC_USER}, password {RPC_PASSWORD})")
+    print(f"Use BITCOIN_RPC_PORT={args.port} BITCOIN_RPC_USER={RPC_USER} BITCOIN_RPC_PASSWORD={RPC_PASSWORD}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+if __name__ == '__main__':
+    main()
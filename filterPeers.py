@@ -1,44 +1,147 @@
 import os
 import json
-import shutil
-import re
+import hashlib
+import ipaddress
+from concurrent.futures import ProcessPoolExecutor
+import peer_store
 
 source_dir = '/media/volume/bitcoin-data/daily_json_files'
-ipv4_dir = '/media/volume/bitcoin-data/daily_ipv4'
-ipv6_dir = '/media/volume/bitcoin-data/daily_ipv6'
-onion_dir = '/media/volume/bitcoin-data/daily_onion'
+output_root = '/media/volume/bitcoin-data'
+manifest_path = os.path.join(output_root, 'daily_split_manifest.json')
 
-files = os.listdir(source_dir)
+# Networks of getpeerinfo, every network is written to daily_<network>
+NETWORKS = ['ipv4', 'ipv6', 'onion', 'i2p', 'cjdns']
+CJDNS_NETWORK = ipaddress.ip_network('fc00::/8')
 
-for filename in files:
-    source_file = os.path.join(source_dir, filename)
+def get_output_dir(network):
+    return os.path.join(output_root, f"daily_{network}")
 
-    with open(source_file, 'r') as file:
-        data = json.load(file)
+def get_summary_path(date, root=None):
+    return os.path.join(root or output_root, 'daily_summary', f"{date}.json")
 
-    ipv4_peers = []
-    ipv6_peers = []
-    onion_peers = []
+def split_host_port(addr):
+    # "1.2.3.4:8333", "[2001:db8::1]:8333" and "abc.onion:8333" -> (host, port), the port may be None
+    if addr.startswith('['):
+        end = addr.find(']')
+        if end != -1:
+            port = addr[end + 2:] if addr[end + 1:end + 2] == ':' else None
+            return addr[1:end], port or None
+    if addr.count(':') == 1:
+        host, port = addr.split(':')
+        return host, port
+    return addr, None
 
-    for peer in data:
-        addr = peer.get('addr', '')
+def get_network_from_address(addr):
+    host, port = split_host_port(addr)
+    if host.endswith('.onion'):
+        return 'onion'
+    if host.endswith('.i2p'):
+        return 'i2p'
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        return None
+    if ip.version == 4:
+        return 'ipv4'
+    return 'cjdns' if ip in CJDNS_NETWORK else 'ipv6'
 
-        if re.match(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', addr):
-            ipv4_peers.append(peer)
-        elif '.onion' in addr:
-            onion_peers.append(peer)
-        elif re.match(r'[a-fA-F0-9:]+', addr):
-            ipv6_peers.append(peer)
+def get_peer_network(peer):
+    # The network field of getpeerinfo, older records (or "not_publicly_routable") fall back to the address
+    network = peer.get('network')
+    if network in NETWORKS:
+        return network
+    return get_network_from_address(peer.get('addr', ''))
 
-    ipv4_dest_file = os.path.join(ipv4_dir, filename)
-    ipv6_dest_file = os.path.join(ipv6_dir, filename)
-    onion_dest_file = os.path.join(onion_dir, filename)
+def build_summary(partitions):
+    # Per network: distinct addresses (with port) and distinct hosts (without port) of a day, used by count_peer_addr
+    summary = {}
+    for network, peers in partitions.items():
+        addresses = sorted({peer['addr'] for peer in peers if 'addr' in peer})
+        hosts = sorted({split_host_port(addr)[0] for addr in addresses})
+        summary[network] = {'with_port': len(addresses), 'without_port': len(hosts), 'addresses': addresses, 'hosts': hosts}
+    return summary
 
-    with open(ipv4_dest_file, 'w') as file:
-        json.dump(ipv4_peers, file, indent=4)
+def write_summary(date, summary, root=None):
+    summary_path = get_summary_path(date, root)
+    os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+    with open(summary_path + '.tmp', 'w') as file:
+        json.dump(summary, file)
+    os.replace(summary_path + '.tmp', summary_path)
 
-    with open(ipv6_dest_file, 'w') as file:
-        json.dump(ipv6_peers, file, indent=4)
+def get_source_path(date):
+    jsonl_path = peer_store.get_jsonl_path(date, source_dir)
+    return jsonl_path if os.path.exists(jsonl_path) else peer_store.get_json_path(date, source_dir)
 
-    with open(onion_dest_file, 'w') as file:
-        json.dump(onion_peers, file, indent=4)
+def get_file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest():
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            return json.load(file)
+    return {}
+
+def save_manifest(manifest):
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(temp_path, manifest_path)
+
+def outputs_exist(date):
+    paths = [os.path.join(get_output_dir(network), f"{date}.json") for network in NETWORKS] + [get_summary_path(date)]
+    return all(os.path.exists(path) for path in paths)
+
+def is_unchanged(date, entry):
+    source_path = get_source_path(date)
+    stat = os.stat(source_path)
+    return entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime and outputs_exist(date)
+
+def split_day(date, previous_hash=None):
+    # Writes the peers of a day to one file per network, unless the content did not change after all
+    source_path = get_source_path(date)
+    stat = os.stat(source_path)
+    file_hash = get_file_hash(source_path)
+    entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': file_hash}
+    if file_hash == previous_hash and outputs_exist(date):
+        return date, entry, None
+
+    partitions = {network: [] for network in NETWORKS}
+    for peer in peer_store.iter_peers(date, source_dir):
+        network = get_peer_network(peer)
+        if network is not None:
+            partitions[network].append(peer)
+
+    for network, peers in partitions.items():
+        dest_file = os.path.join(get_output_dir(network), f"{date}.json")
+        with open(dest_file + '.tmp', 'w') as file:
+            json.dump(peers, file)
+        os.replace(dest_file + '.tmp', dest_file)
+    write_summary(date, build_summary(partitions))
+
+    return date, entry, {network: len(peers) for network, peers in partitions.items()}
+
+def main():
+    for network in NETWORKS:
+        os.makedirs(get_output_dir(network), exist_ok=True)
+
+    manifest = load_manifest()
+    changed_dates = [date for date in peer_store.list_dates(source_dir) if not is_unchanged(date, manifest.get(date))]
+    if not changed_dates:
+        print("All days are up to date.")
+        return
+
+    with ProcessPoolExecutor() as executor:
+        previous_hashes = [manifest.get(date, {}).get('sha256') for date in changed_dates]
+        for date, entry, counts in executor.map(split_day, changed_dates, previous_hashes):
+            manifest[date] = entry
+            if counts is not None:
+                print(f"{date}: " + ", ".join(f"{network} {count}" for network, count in counts.items()))
+
+    save_manifest(manifest)
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,101 @@
-import subprocess
 import json
 import datetime
 import os
+import time
+import argparse
+import bitcoin_rpc
+
+directory = '../bitcoin-data/daily_mempool_info'
+state_file = os.path.join(directory, 'last_snapshot.json')
 
 def get_mempool_entries():
-    # Execute the command `bitcoin-cli getrawmempool true` and retrieve the mempool entries
-    command = 'bitcoin-cli getrawmempool true'
-    result = subprocess.run(command, shell=True, capture_output=True, text=True)
-    if result.returncode == 0:
-        mempool_hashes = json.loads(result.stdout)
-        mempool_entries = []
-        limit = 100
-        mempool_hashes_list = list(mempool_hashes)
-        for hash_value in mempool_hashes_list[:limit]:
-            entry_command = f'bitcoin-cli getmempoolentry {hash_value}'
-            entry_result = subprocess.run(entry_command, shell=True, capture_output=True, text=True)
-            if entry_result.returncode == 0:
-                entry_info = json.loads(entry_result.stdout)
-                mempool_entries.append(entry_info)
-        return mempool_entries
-    else:
+    # `getrawmempool true` already returns the verbose entry for every transaction
+    try:
+        return bitcoin_rpc.call('getrawmempool', True)
+    except (bitcoin_rpc.RPCError, OSError) as e:
         print('Error retrieving mempool entries:')
-        print(result.stderr)
+        print(e)
+        return None
+
+def get_snapshot_file(date):
+    return os.path.join(directory, f'mempool_snapshots_{date}.jsonl')
+
+def load_previous_txids(date):
+    # The first snapshot of a day is written in full, so every daily log can be replayed on its own
+    if not os.path.exists(state_file):
+        return set()
+    try:
+        with open(state_file, 'r') as file:
+            state = json.load(file)
+    except json.JSONDecodeError:
+        return set()
+    if state.get('date') != date:
+        return set()
+    return set(state['txids'])
+
+def save_txids(date, txids):
+    temp_file = state_file + '.tmp'
+    with open(temp_file, 'w') as file:
+        json.dump({'date': date, 'txids': list(txids)}, file)
+    os.replace(temp_file, state_file)
+
+def make_snapshot(mempool_entries, previous_txids):
+    current_txids = set(mempool_entries)
+    added = {txid: mempool_entries[txid] for txid in current_txids - previous_txids}
+    removed = sorted(previous_txids - current_txids)
+    return {
+        'time': datetime.datetime.now().isoformat(),
+        'full': not previous_txids,
+        'size': len(current_txids),
+        'added': added,
+        'removed': removed
+    }
 
-def write_to_json(mempool_entries):
-    # Create the directory if it doesn't exist
-    directory = '../bitcoin-data/daily_mempool_info'
+def write_snapshot(date, snapshot):
     os.makedirs(directory, exist_ok=True)
+    filename = get_snapshot_file(date)
+    with open(filename, 'a') as file:
+        file.write(json.dumps(snapshot) + '\n')
+    print(f"Mempool snapshot saved in {filename} ({len(snapshot['added'])} added, {len(snapshot['removed'])} removed).")
 
-    # Write the mempool entries to a JSON file
-    timestamp = datetime.datetime.now().strftime('%d-%m-%Y')
-    filename = f'{directory}/mempool_entries_{timestamp}.json'
+def replay_snapshots(filename):
+    # Yields (time, mempool) after every snapshot of a daily log, mempool maps txid -> entry
+    mempool = {}
+    with open(filename, 'r') as file:
+        for line in file:
+            snapshot = json.loads(line)
+            if snapshot['full']:
+                mempool = {}
+            for txid in snapshot['removed']:
+                mempool.pop(txid, None)
+            mempool.update(snapshot['added'])
+            yield snapshot['time'], mempool
 
-    if os.path.exists(filename):
-        with open(filename, 'r') as file:
-            existing_data = json.load(file)
-        existing_data.extend(mempool_entries)
-        mempool_entries = existing_data
+def take_snapshot(previous_txids, previous_date):
+    date = datetime.datetime.now().strftime('%d-%m-%Y')
+    if previous_txids is None or previous_date != date:
+        previous_txids = load_previous_txids(date)
 
-    with open(filename, 'w') as file:
-        json.dump(mempool_entries, file, indent=4)
-    print(f'Mempool entries saved in {filename}.')
+    mempool_entries = get_mempool_entries()
+    if mempool_entries is None:
+        return previous_txids, date
+
+    snapshot = make_snapshot(mempool_entries, previous_txids)
+    write_snapshot(date, snapshot)
+    current_txids = set(mempool_entries)
+    save_txids(date, current_txids)
+    return current_txids, date
+
+def main():
+    parser = argparse.ArgumentParser(description='Record mempool snapshots as daily diff logs')
+    parser.add_argument('--interval', type=float, help='Keep running and take a snapshot every INTERVAL seconds')
+    args = parser.parse_args()
+
+    os.makedirs(directory, exist_ok=True)
+    txids, date = take_snapshot(None, None)
+    while args.interval:
+        time.sleep(args.interval)
+        txids, date = take_snapshot(txids, date)
 
-# Main program
-mempool_entries = get_mempool_entries()
-if mempool_entries:
-    write_to_json(mempool_entries)
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,25 @@
-import subprocess
-import time
-import json
 import random
+import asyncio
 from datetime import datetime
+import bitcoin_rpc
+from ping_detector import EwmaDetector, RingBufferDetector
+from segment_writer import SegmentWriter
 
 # Anpassbare Variablen
 PING_INTERVAL = 10  # Zeit zwischen Pings in Sekunden
+SAMPLES_PER_CYCLE = 3  # Anzahl der Ping-Messungen pro Durchlauf
+DETECTOR = 'ewma'  # Anomalieerkennung: 'ewma' (eigene Baseline pro Peer) oder 'buffer' (Median des Ringpuffers)
+HISTORY_SIZE = 12  # Anzahl der gespeicherten Messungen pro Peer (Ringpuffer)
+EWMA_ALPHA = 0.1  # Gewichtung neuer Messungen für Mittelwert und Varianz
+EWMA_Z_SCORE = 3.0  # Anzahl Standardabweichungen, ab der eine Messung die Baseline verlässt
+EWMA_WARMUP = 10  # Anzahl Messungen pro Peer, bevor Anomalien gemeldet werden
 CHECK_INTERVAL_LOWER = 15  # Untere Grenze des Zeitintervalls zwischen den Durchläufen in Sekunden
 CHECK_INTERVAL_UPPER = 25  # Obere Grenze des Zeitintervalls zwischen den Durchläufen in Sekunden
-LOG_FILE = '../bitcoin-data/analysis/ping/heartbeat.log'  # Speicherort der Log-Datei
+LOG_DIRECTORY = '../bitcoin-data/analysis/ping/pinglogs'  # Verzeichnis der Log-Segmente (mit manifest.jsonl)
+LOG_SUFFIX = '_ping_anomaly.log'  # Dateiendung der Log-Segmente
+LOG_MAX_MB = 30  # Maximale Größe eines Segments in MB
+LOG_MAX_AGE = 24 * 3600  # Maximales Alter eines Segments in Sekunden
+LOG_COMPRESSION = None  # Komprimierung abgeschlossener Segmente: None, 'gzip' oder 'zstd'
 PING_THRESHOLD = 0.30  # Schwellenwert für die Anomalieerkennung (30% Änderung)
 
 def calculate_percentage_difference(old_value, new_value):
@@ -18,28 +29,43 @@ def calculate_percentage_difference(old_value, new_value):
     return ((new_value - old_value) / abs(old_value)) * 100.0
 
 def get_peer_info():
-    command = 'bitcoin-cli getpeerinfo'
-    result = subprocess.check_output(command.split()).decode('utf-8')
-    return json.loads(result)
+    return bitcoin_rpc.call('getpeerinfo')
 
 def ping_addresses():
-    command = f'bitcoin-cli ping'
-    subprocess.run(command.split())
-
-def check_ping_changes(old_peers, new_peers):
+    bitcoin_rpc.call('ping')
+
+def index_peers(peer_info):
+    return {peer["addr"]: peer for peer in peer_info if "addr" in peer}
+
+async def sample_peers():
+    # Take several ping samples and collect (pingtime, minping) per address
+    samples = {}
+    peers = {}
+    for sample in range(SAMPLES_PER_CYCLE):
+        await asyncio.to_thread(ping_addresses)
+        await asyncio.sleep(PING_INTERVAL / SAMPLES_PER_CYCLE)
+        peers = index_peers(await asyncio.to_thread(get_peer_info))
+        for addr, peer in peers.items():
+            if "pingtime" in peer:
+                samples.setdefault(addr, []).append((peer["pingtime"], peer.get("minping", peer["pingtime"])))
+    return peers, samples
+
+def make_detector():
+    if DETECTOR == 'buffer':
+        return RingBufferDetector(PING_THRESHOLD, HISTORY_SIZE)
+    return EwmaDetector(PING_THRESHOLD, EWMA_ALPHA, EWMA_Z_SCORE, EWMA_WARMUP)
+
+def check_ping_changes(detector, samples):
     log = []
-    for old_peer in old_peers:
-        old_ping = old_peer.get("pingtime", -1)
-        new_ping = next((new_peer.get("pingtime", -1) for new_peer in new_peers if new_peer["addr"] == old_peer["addr"]), -1)
-        if old_ping != -1 and new_ping != -1 and abs(new_ping - old_ping) / old_ping > PING_THRESHOLD:
-            changes = abs(new_ping - old_ping) / old_ping
-            log.append(f'Anomaly: Ping time change for {old_peer["addr"]}; Old Ping: {old_ping}, New Ping: {new_ping}, Changes: {changes}')
+    for addr, peer_samples in samples.items():
+        anomaly = detector.update(addr, peer_samples)
+        if anomaly:
+            old_ping, new_ping, changes = anomaly
+            log.append(f'Anomaly: Ping time change for {addr}; Old Ping: {old_ping}, New Ping: {new_ping}, Changes: {changes}')
     return log
 
-def check_new_peers(old_peers, new_peers):
+def check_new_peers(old_addresses, new_addresses):
     log = []
-    old_addresses = set(peer["addr"] for peer in old_peers)
-    new_addresses = set(peer["addr"] for peer in new_peers)
     added_peers = new_addresses - old_addresses
     removed_peers = old_addresses - new_addresses
 
@@ -50,25 +76,27 @@ def check_new_peers(old_peers, new_peers):
 
     return log
 
-def write_to_log(log):
+def write_to_log(writer, log):
     if log:
-        with open(LOG_FILE, 'a') as log_file:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_file.write(f'{timestamp}\n' + '\n'.join(log) + '\n')
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        writer.write(f'{timestamp}\n' + '\n'.join(log) + '\n')
+    writer.roll_if_due()
 
-if __name__ == "__main__":
+async def run_heartbeat(writer):
+    detector = make_detector()
+    old_addresses = None
     while True:
         try:
-            print("Getting peer info...")
-            old_peers = get_peer_info()
-            ping_addresses()
-            print("Ping sent to all addresses. Waiting for 10 seconds...")
-            time.sleep(PING_INTERVAL)
+            print(f"Sampling ping times ({SAMPLES_PER_CYCLE} samples in {PING_INTERVAL} seconds)...")
+            peers, samples = await sample_peers()
+            new_addresses = set(peers)
 
-            new_peers = get_peer_info()
+            ping_log = check_ping_changes(detector, samples)
+            new_peer_log = check_new_peers(old_addresses, new_addresses) if old_addresses is not None else []
 
-            ping_log = check_ping_changes(old_peers, new_peers)
-            new_peer_log = check_new_peers(old_peers, new_peers)
+            # Forget peers that are no longer connected, so memory stays bounded
+            detector.forget(detector.peers() - new_addresses)
+            old_addresses = new_addresses
 
             log = ping_log + new_peer_log
 
@@ -78,11 +106,21 @@ if __name__ == "__main__":
                     print(entry)
                 print("============")
 
-            write_to_log(log)
+            write_to_log(writer, log)
         except Exception as e:
             print(f"Error occurred: {e}")
 
         # Generate a random time interval between CHECK_INTERVAL_LOWER and CHECK_INTERVAL_UPPER seconds
         random_interval = random.randint(CHECK_INTERVAL_LOWER, CHECK_INTERVAL_UPPER)
         print(f"Next check in {random_interval} seconds...")
-        time.sleep(random_interval)
+        await asyncio.sleep(random_interval)
+
+def main():
+    writer = SegmentWriter(LOG_DIRECTORY, LOG_SUFFIX, LOG_MAX_MB * 1024 * 1024, LOG_MAX_AGE, LOG_COMPRESSION)
+    try:
+        asyncio.run(run_heartbeat(writer))
+    finally:
+        writer.close()
+
+if __name__ == "__main__":
+    main()
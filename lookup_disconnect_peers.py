@@ -2,14 +2,13 @@ import os
 import json
 from datetime import datetime
 from tqdm import tqdm
+import peer_store
 
-# Funktion, um die Adresse aus der JSON-Datei abzurufen
-def get_address_from_json(json_file, peer_id):
-    with open(json_file, 'r') as f:
-        data = json.load(f)
-        for peer_info in data:
-            if peer_info.get('id') == peer_id:
-                return peer_info.get('addr')
+# Funktion, um die Adresse aus den Peers des Tages abzurufen
+def get_address_from_json(json_files_dir, date, peer_id):
+    for peer_info in peer_store.iter_peers(date, json_files_dir):
+        if peer_info.get('id') == peer_id:
+            return peer_info.get('addr')
     return None
 
 def main():
@@ -43,9 +42,7 @@ def main():
                 day = date_time_obj.strftime("%d")
                 month = date_time_obj.strftime("%m")
                 year = date_time_obj.strftime("%Y")
-                json_file_path = os.path.join(json_files_dir, f"{day}-{month}-{year}.json")
-
-                address = get_address_from_json(json_file_path, peer_id)
+                address = get_address_from_json(json_files_dir, f"{day}-{month}-{year}", peer_id)
 
                 if address is not None:
                     new_log_file.write(f"{timestamp_line}\nPeer disconnected: {address}\n")
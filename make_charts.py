@@ -1,23 +1,53 @@
 import os
-from collections import Counter
-import re
+import json
+import sqlite3
+import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use('Agg')  # Charts are only saved to files
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 
-def extract_subver_values(file_path):
-    with open(file_path, "r") as file:
-        contents = file.read()
-        return re.findall(r'"subver": "([^"]+)"', contents)
-
-def get_unique_addresses(file_path):
-    with open(file_path, "r") as file:
-        contents = file.read()
-        return set(re.findall(r'"addr": "([^"]+)"', contents))
-
-def get_top_n_subver(subver_values, n):
-    subver_count = Counter(subver_values)
-    top_subver = subver_count.most_common(n)
-    return top_subver
+input_directory = "../bitcoin-data/"
+output_directory = "../bitcoin-data/analysis/graphs/"
+rollup_path = "../bitcoin-data/analysis/subver_rollup.sqlite"
+categories = ["ipv4", "ipv6", "onion"]
+date_format = "%d-%m-%Y"
+top_n = 10
+
+# Rollup of the daily peer files: peers and distinct addresses per (date, network, subver), and the distinct
+# addresses per (date, network) with the size and mtime of the daily file. A day is added once it is closed
+# (before today) and read again only if its file changed, charts of any date range are queried from the rollup.
+# Ties are ordered by first appearance (date, then position of the first peer in the daily file) like Counter.most_common.
+
+def open_rollup(path=rollup_path):
+    connection = sqlite3.connect(path)
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(subver_rollup)")]
+    if columns and "first_position" not in columns:
+        # Rollup of an older version without the tie order, it is rebuilt from the daily files
+        connection.execute("DROP TABLE subver_rollup")
+        connection.execute("DROP TABLE IF EXISTS rollup_days")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS subver_rollup ("
+        "date TEXT NOT NULL, network TEXT NOT NULL, subver TEXT NOT NULL, peers INTEGER NOT NULL, "
+        "addresses INTEGER NOT NULL, first_position INTEGER NOT NULL, PRIMARY KEY (network, date, subver))"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS rollup_days ("
+        "date TEXT NOT NULL, network TEXT NOT NULL, addresses INTEGER NOT NULL, size INTEGER, mtime REAL, "
+        "PRIMARY KEY (network, date))"
+    )
+    return connection
+
+def to_iso(date_str):
+    return datetime.strptime(date_str, date_format).strftime("%Y-%m-%d")
+
+def from_iso(iso_date):
+    return datetime.strptime(iso_date, "%Y-%m-%d").strftime(date_format)
+
+def get_daily_path(category, date_str):
+    return os.path.join(input_directory, f"daily_{category}", f"{date_str}.json")
 
 def create_bar_chart(data, title, output_path):
     subvers, counts = zip(*data)
@@ -30,7 +60,7 @@ def create_bar_chart(data, title, output_path):
     plt.close()
 
 def is_address_excluded(ip_address):
-    excluded_subnets = ["127.0.0"] 
+    excluded_subnets = ["127.0.0"]
     ip_parts = ip_address.split(":")
     ip = ip_parts[0]  # Use only the IP part, ignore the port if present
     for subnet in excluded_subnets:
@@ -38,57 +68,149 @@ def is_address_excluded(ip_address):
             return True
     return False
 
-def main():
-    input_directory = "../bitcoin-data/"
-    output_directory = "../bitcoin-data/analysis/graphs/"
-    categories = ["ipv4", "ipv6", "onion"]
-    top_n = 10
-
-    # Get the date of the second newest file
-    now = datetime.now()
-    second_newest_date = now - timedelta(days=1)
-    second_newest_date_str = second_newest_date.strftime("%d-%m-%Y")
-
-    all_addresses = set()
-
+def summarize_day(file_path):
+    # (subver -> (peers, distinct addresses, position of the first peer), distinct addresses outside the excluded
+    # subnets) of one daily file
+    with open(file_path, "r") as file:
+        peers = json.load(file)
+    subver_peers = Counter()
+    subver_addresses = defaultdict(set)
+    first_positions = {}
+    addresses = set()
+    for position, peer in enumerate(peers):
+        subver = peer.get("subver")
+        address = peer.get("addr")
+        if subver:
+            subver_peers[subver] += 1
+            first_positions.setdefault(subver, position)
+            if address:
+                subver_addresses[subver].add(address)
+        if address and not is_address_excluded(address):
+            addresses.add(address)
+    return {subver: (count, len(subver_addresses[subver]), first_positions[subver])
+            for subver, count in subver_peers.items()}, len(addresses)
+
+def update_rollup(connection):
+    # Adds all closed days that are missing in the rollup or whose daily file changed
+    today = datetime.now().date()
+    pending = []
     for category in categories:
-        file_paths = [os.path.join(input_directory, f"daily_{category}", file_name) for file_name in os.listdir(os.path.join(input_directory, f"daily_{category}"))]
-
-        # Filter the file paths to include only the second newest date file and older
-        file_paths_vortag = [file_path for file_path in file_paths if second_newest_date_str in file_path]
-
-        if len(file_paths_vortag) == 0:
-            print(f"No data available for {category.upper()} Peers on {second_newest_date_str}")
+        folder = os.path.join(input_directory, f"daily_{category}")
+        if not os.path.isdir(folder):
             continue
-
-        all_subver_values = []
-
-        for file_path in file_paths_vortag:  # Only consider the second newest date file and older
-            date_str = os.path.splitext(os.path.basename(file_path))[0]  # Extract the date part from the filename
-            subver_values = extract_subver_values(file_path)
-            all_subver_values.extend(subver_values)
-
-            # Get unique addresses from the current file
-            addresses = get_unique_addresses(file_path)
-
-            # Filter excluded addresses
-            addresses = [address for address in addresses if not is_address_excluded(address)]
-            all_addresses.update(addresses)
-
-        top_subver = get_top_n_subver(all_subver_values, top_n)
-
-        print(f"Top {top_n} subver values for {category.upper()} Peers on {second_newest_date_str}:")
+        known = {date: (size, mtime) for date, size, mtime in connection.execute(
+            "SELECT date, size, mtime FROM rollup_days WHERE network = ?", (category,))}
+        for file_name in os.listdir(folder):
+            if not file_name.endswith(".json"):
+                continue
+            date_str = file_name[:-len(".json")]
+            if datetime.strptime(date_str, date_format).date() >= today:
+                continue
+            stat = os.stat(os.path.join(folder, file_name))
+            if known.get(to_iso(date_str)) != (stat.st_size, stat.st_mtime):
+                pending.append((category, date_str, stat.st_size, stat.st_mtime))
+
+    if not pending:
+        return 0
+    with ProcessPoolExecutor() as executor:
+        summaries = executor.map(summarize_day, [get_daily_path(category, date_str) for category, date_str, _, _ in pending])
+        for (category, date_str, size, mtime), (subvers, address_count) in zip(pending, summaries):
+            iso_date = to_iso(date_str)
+            connection.execute("DELETE FROM subver_rollup WHERE network = ? AND date = ?", (category, iso_date))
+            connection.executemany(
+                "INSERT INTO subver_rollup VALUES (?, ?, ?, ?, ?, ?)",
+                [(iso_date, category, subver, peers, addresses, position)
+                 for subver, (peers, addresses, position) in subvers.items()]
+            )
+            connection.execute("INSERT OR REPLACE INTO rollup_days VALUES (?, ?, ?, ?, ?)",
+                               (iso_date, category, address_count, size, mtime))
+            connection.commit()
+    return len(pending)
+
+def query_top_subver(connection, category, start_date, end_date, n=top_n):
+    # [(subver, peers)] of the n most common subver values from start_date to end_date (dd-mm-YYYY, both included)
+    return connection.execute(
+        "SELECT subver, SUM(peers) AS total FROM subver_rollup WHERE network = ? AND date BETWEEN ? AND ? "
+        "GROUP BY subver ORDER BY total DESC, MIN(date || printf('%010d', first_position)) LIMIT ?",
+        (category, to_iso(start_date), to_iso(end_date), n)
+    ).fetchall()
+
+def query_address_count(connection, start_date, end_date):
+    # Sum of the distinct addresses of every day, the same address on two days is counted twice
+    row = connection.execute(
+        "SELECT SUM(addresses) FROM rollup_days WHERE date BETWEEN ? AND ?", (to_iso(start_date), to_iso(end_date))
+    ).fetchone()
+    return row[0] or 0
+
+def get_chart_path(category, start_date, end_date):
+    if start_date == end_date:
+        return os.path.join(output_directory, f"{category}_subver_distribution_{start_date}.png")
+    return os.path.join(output_directory, f"{category}_subver_distribution_{start_date}_{end_date}.png")
+
+def get_period(start_date, end_date):
+    return start_date if start_date == end_date else f"{start_date} - {end_date}"
+
+def render_chart(category, start_date, end_date, n=top_n, verbose=False):
+    # Opens its own connection, so charts can be rendered in worker processes
+    connection = sqlite3.connect(rollup_path)
+    top_subver = query_top_subver(connection, category, start_date, end_date, n)
+    connection.close()
+    period = get_period(start_date, end_date)
+    if not top_subver:
+        print(f"No data available for {category.upper()} Peers on {period}")
+        return None
+
+    if verbose:
+        print(f"Top {n} subver values for {category.upper()} Peers on {period}:")
         for subver, count in top_subver:
             print(f"{subver}: {count}")
 
-        data = [(subver, count) for subver, count in top_subver]
-        title = f"Top {top_n} subver values for {category.upper()} Peers on {second_newest_date_str}"
-        output_path = os.path.join(output_directory, f"{category}_subver_distribution_{second_newest_date_str}.png")
-
-        create_bar_chart(data, title, output_path)
+    title = f"Top {n} subver values for {category.upper()} Peers on {period}"
+    output_path = get_chart_path(category, start_date, end_date)
+    create_bar_chart(top_subver, title, output_path)
+    return output_path
+
+def render_missing_charts(connection, n=top_n):
+    # Daily charts of all days in the rollup that have no chart yet
+    jobs = []
+    for category, iso_date in connection.execute("SELECT DISTINCT network, date FROM subver_rollup ORDER BY date"):
+        date_str = from_iso(iso_date)
+        if not os.path.exists(get_chart_path(category, date_str, date_str)):
+            jobs.append((category, date_str))
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(render_chart, [category for category, _ in jobs], [date_str for _, date_str in jobs],
+                          [date_str for _, date_str in jobs], [n] * len(jobs)))
+    return len(jobs)
 
-    unique_address_count = len(all_addresses)
-    print(f"Total number of unique addresses on {second_newest_date_str} (excluding excluded subnets): {unique_address_count}")
+def main():
+    parser = argparse.ArgumentParser(description='Charts of the subver values of the daily peers')
+    parser.add_argument('--from', dest='start_date', help='First day of the chart (dd-mm-YYYY), default yesterday')
+    parser.add_argument('--to', dest='end_date', help='Last day of the chart (dd-mm-YYYY), default the first day')
+    parser.add_argument('--top', type=int, default=top_n, help='Number of subver values in a chart')
+    parser.add_argument('--batch', action='store_true', help='Render the daily charts of all days without a chart')
+    args = parser.parse_args()
+
+    os.makedirs(output_directory, exist_ok=True)
+    connection = open_rollup()
+    update_rollup(connection)
+
+    if args.batch:
+        print(f"Rendered {render_missing_charts(connection, args.top)} charts.")
+        connection.close()
+        return
+
+    # The default is the day before today, the newest closed day
+    start_date = args.start_date or (datetime.now() - timedelta(days=1)).strftime(date_format)
+    end_date = args.end_date or start_date
+    for category in categories:
+        render_chart(category, start_date, end_date, args.top, verbose=True)
+
+    unique_address_count = query_address_count(connection, start_date, end_date)
+    connection.close()
+    if start_date == end_date:
+        print(f"Total number of unique addresses on {start_date} (excluding excluded subnets): {unique_address_count}")
+    else:
+        print(f"Total number of unique addresses per day from {start_date} to {end_date} (excluding excluded subnets): {unique_address_count}")
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,14 @@
 import os
 import json
-import subprocess
+import dbm
+import bitcoin_rpc
+import peer_store
+import change_log
 from datetime import datetime, timedelta
 
 data_folder = '../bitcoin-data/daily_json_files/'
 analysis_folder = '../bitcoin-data/analysis/changes/'
+state_index_path = '../bitcoin-data/analysis/changes_last_state'
 
 thresholds = {
     "services": 0,
@@ -31,42 +35,74 @@ thresholds = {
     "minfeefilter": 0
 }
 
-def get_latest_data_file():
-    json_files = sorted(os.listdir(data_folder), reverse=True)
-    for filename in json_files:
-        file_path = os.path.join(data_folder, filename)
-        if is_file_within_last_days(file_path, 2):
-            return file_path
+def get_latest_data_date():
+    for date in reversed(peer_store.list_dates(data_folder)):
+        if is_date_within_last_days(date, 2):
+            return date
     return None
 
-def is_file_within_last_days(file_path, num_days):
-    file_date_str = os.path.splitext(os.path.basename(file_path))[0]
+def is_date_within_last_days(file_date_str, num_days):
     file_date = datetime.strptime(file_date_str, "%d-%m-%Y")
     days_ago = datetime.now() - timedelta(days=num_days)
     return file_date >= days_ago
 
 def get_existing_addresses():
     existing_addresses = set()
-    latest_data_file = get_latest_data_file()
-    if latest_data_file:
-        with open(latest_data_file, 'r') as file:
+    latest_data_date = get_latest_data_date()
+    if latest_data_date:
+        try:
+            for item in peer_store.iter_peers(latest_data_date, data_folder):
+                if isinstance(item, dict) and 'addr' in item:
+                    existing_addresses.add(item['addr'])
+        except json.JSONDecodeError:
+            pass
+    #print("Existing Addresses:", existing_addresses)
+    return existing_addresses
+
+def read_analysis_file(file_path):
+    # Records are JSON objects separated by a comma at the start of the next line (see save_analysis_file),
+    # files written as one JSON list are read as well
+    with open(file_path, 'r') as file:
+        content = file.read()
+    try:
+        data = json.loads(content)
+        return data if isinstance(data, list) else [data]
+    except json.JSONDecodeError:
+        pass
+    records = []
+    for line in content.splitlines():
+        line = line.lstrip(',').strip()
+        if line:
             try:
-                data = json.load(file)
-                for item in data:
-                    if isinstance(item, dict) and 'addr' in item:
-                        existing_addresses.add(item['addr'])
+                records.append(json.loads(line))
             except json.JSONDecodeError:
                 pass
-    #print("Existing Addresses:", existing_addresses)
-    return existing_addresses
+    return records
+
+def open_state_index():
+    # addr -> last recorded peerinfo, rebuilt from the old analysis files and the change log if it is missing
+    rebuild = dbm.whichdb(state_index_path) is None
+    index = dbm.open(state_index_path, 'c')
+    if rebuild:
+        filenames = [filename for filename in os.listdir(analysis_folder)
+                     if filename.endswith('.json') and peer_store.is_date(filename[:-len('.json')])]
+        filenames.sort(key=lambda filename: datetime.strptime(filename[:-len('.json')], "%d-%m-%Y"))
+        for filename in filenames:
+            for item in read_analysis_file(os.path.join(analysis_folder, filename)):
+                if isinstance(item, dict) and 'addr' in item and 'change_new' in item:
+                    index[item['addr']] = json.dumps(item['change_new'])
+        if os.path.isdir(change_log.change_log_folder):
+            for address, state in change_log.get_latest_states().items():
+                index[address] = json.dumps(state)
+    return index
 
-def check_peerinfo_changes(peerinfo, existing_addresses):
-    timestamp = datetime.now().isoformat()
+def check_peerinfo_changes(peerinfo, existing_addresses, index, writer):
+    timestamp = datetime.now()
     for item in peerinfo:
         if isinstance(item, dict) and 'addr' in item:
             address = item['addr']
             if address in existing_addresses:
-                existing_data = get_existing_data(address)
+                existing_data = get_existing_data(index, address)
                 if existing_data is not None and existing_data != item:
                     has_changes = False
                     for key, value in item.items():
@@ -81,61 +117,22 @@ def check_peerinfo_changes(peerinfo, existing_addresses):
                                     has_changes = True
                                     break
                     if has_changes:
-                        if not is_change_already_recorded(address, item):
-                            output = {
-                                'addr': address,
-                                'time': timestamp,
-                                'change_old': existing_data,
-                                'change_new': item
-                            }
-                            save_analysis_file(output)
-
-def get_existing_data(address):
-    analysis_files = sorted(os.listdir(analysis_folder), reverse=True)
-    for filename in analysis_files:
-        file_path = os.path.join(analysis_folder, filename)
-        with open(file_path, 'r') as file:
-            try:
-                data = json.load(file)
-                for item in data:
-                    if isinstance(item, dict) and 'addr' in item and item['addr'] == address:
-                        return item.get('change_new')
-            except json.JSONDecodeError:
-                pass
-    return None
+                        save_change(writer, index, address, timestamp, existing_data, item)
 
-def is_change_already_recorded(address, item):
-    analysis_files = sorted(os.listdir(analysis_folder), reverse=True)
-    for filename in analysis_files:
-        file_path = os.path.join(analysis_folder, filename)
-        with open(file_path, 'r') as file:
-            try:
-                data = json.load(file)
-                for existing_item in data:
-                    if isinstance(existing_item, dict) and 'addr' in existing_item and existing_item['addr'] == address:
-                        if existing_item.get('change_new') == item:
-                            return True
-            except json.JSONDecodeError:
-                pass
-    return False
+def get_existing_data(index, address):
+    state = index.get(address)
+    return json.loads(state) if state is not None else None
 
-def save_analysis_file(output):
-    timestamp = datetime.now().strftime('%d-%m-%Y')
-    file_name = f"{timestamp}.json"
-    file_path = os.path.join(analysis_folder, file_name)
-    with open(file_path, 'a+') as file:
-        file.seek(0)
-        data = file.read()
-        if len(data) > 0:
-            file.write(',')
-        json.dump(output, file)
-        file.write('\n')
+def save_change(writer, index, address, timestamp, change_old, change_new):
+    # Only the changed fields are written to the change log, see change_log.py
+    writer.record(address, timestamp, change_old, change_new)
+    index[address] = json.dumps(change_new)
 
 def main():
     existing_addresses = get_existing_addresses()
-    command_output = subprocess.check_output(['bitcoin-cli', 'getpeerinfo'])
-    peerinfo = json.loads(command_output)
-    check_peerinfo_changes(peerinfo, existing_addresses)
+    peerinfo = bitcoin_rpc.call('getpeerinfo')
+    with open_state_index() as index, change_log.ChangeLogWriter() as writer:
+        check_peerinfo_changes(peerinfo, existing_addresses, index, writer)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,300 @@
+import os
+import json
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from stats_accumulator import Accumulator
+
+# Statistics of the daily peer files of every network. A network only needs an entry here,
+# ip_stats.py and onion_stats.py run the ipv4 and onion entries.
+STATS_CONFIG = {
+    'ipv4': {'daily_folder': '../bitcoin-data/daily_ipv4', 'stats_folder': '../bitcoin-data/analysis/stats/ipv4'},
+    'ipv6': {'daily_folder': '../bitcoin-data/daily_ipv6', 'stats_folder': '../bitcoin-data/analysis/stats/ipv6'},
+    'onion': {'daily_folder': '../bitcoin-data/daily_onion', 'stats_folder': '../bitcoin-data/analysis/stats/onion'},
+    'i2p': {'daily_folder': '../bitcoin-data/daily_i2p', 'stats_folder': '../bitcoin-data/analysis/stats/i2p'},
+    'cjdns': {'daily_folder': '../bitcoin-data/daily_cjdns', 'stats_folder': '../bitcoin-data/analysis/stats/cjdns'},
+}
+
+# Every day also gets accumulators/<date>.json with mergeable accumulators of its fields (see stats_accumulator.py)
+# and the size and mtime of its daily file, a day is only read again when its file changed. general_state.json
+# holds the merged accumulators of all days but the latest, so general.json is updated by merging one day.
+ACCUMULATOR_FOLDER = 'accumulators'
+GENERAL_STATE_FILE = 'general_state.json'
+GENERAL_QUANTILES = {'p5': 0.05, 'p25': 0.25, 'median': 0.5, 'p75': 0.75, 'p95': 0.95}
+
+# Function to convert the numerical version number to its corresponding string representation
+def convert_version(version_num):
+    major = version_num // 10000
+    minor = (version_num // 100) % 100
+    patch = version_num % 100
+    return f"v{major}.{minor}.{patch}"
+
+def is_number(value):
+    return isinstance(value, (int, float))
+
+def load_columns(data):
+    # One column per numeric field (key, or key and sub-key of a dictionary) of the first peer, filled in a
+    # single pass over the peers. 'present' marks peers that have the field at all, 'numeric' those with a number.
+    fields = []
+    for key, value in data[0].items():
+        if is_number(value):
+            fields.append((key, None))
+        elif isinstance(value, dict):
+            fields.extend((key, sub_key) for sub_key in value)
+
+    values = np.zeros((len(fields), len(data)))
+    present = np.zeros((len(fields), len(data)), dtype=bool)
+    numeric = np.zeros((len(fields), len(data)), dtype=bool)
+    has_float = np.zeros(len(fields), dtype=bool)
+    all_bool = np.ones(len(fields), dtype=bool)
+    ids = np.zeros(len(data), dtype=np.int64)
+    for column, entry in enumerate(data):
+        for row, (key, sub_key) in enumerate(fields):
+            if key not in entry:
+                continue
+            value = entry[key]
+            if sub_key is not None:
+                if not isinstance(value, dict) or sub_key not in value:
+                    continue
+                value = value[sub_key]
+            present[row, column] = True
+            if is_number(value):
+                numeric[row, column] = True
+                values[row, column] = value
+                has_float[row] |= isinstance(value, float)
+                all_bool[row] &= isinstance(value, bool)
+        if present[:, column].any():
+            ids[column] = entry['id']
+    return fields, values, present, numeric, has_float, all_bool, ids
+
+EXACT_SUM_CHUNK = 1024  # Mantissas below 2**53 summed at once stay below 2**63
+
+def exact_mean(values):
+    # Mean of the exact sum with a single rounding, like statistics.mean. Every float is an integer mantissa times
+    # a power of two, the mantissas are summed in int64 per exponent and the few partial sums as Python integers.
+    mantissas, exponents = np.frexp(values)
+    mantissas = np.ldexp(mantissas, 53).astype(np.int64)
+    lowest = int(exponents.min())
+    total = 0
+    for exponent in np.unique(exponents):
+        group = mantissas[exponents == exponent]
+        partial = sum(int(group[start:start + EXACT_SUM_CHUNK].sum()) for start in range(0, len(group), EXACT_SUM_CHUNK))
+        total += partial << int(exponent - lowest)
+    # The value is total * 2 ** (lowest - 53), integer true division is correctly rounded
+    shift = lowest - 53
+    return (total << shift) / len(values) if shift >= 0 else total / (len(values) << -shift)
+
+def to_number(value, integral):
+    # Integer fields keep integer results where they are whole numbers, like statistics.mean and median do
+    value = float(value)
+    return int(value) if integral and value.is_integer() else value
+
+# Calculate daily statistics and the accumulators of the fields for a given file
+def calculate_daily_stats(file_path):
+    date_str = os.path.basename(file_path).split('.')[0]
+    with open(file_path) as file:
+        data = json.load(file)
+
+    if not data:
+        return None, None
+
+    fields, values, present, numeric, has_float, all_bool, ids = load_columns(data)
+    counts = numeric.sum(axis=1)
+    numeric_values = np.where(numeric, values, np.nan)
+    numeric_values[counts == 0] = 0  # Fields without numbers are skipped below
+    medians = np.nanmedian(numeric_values, axis=1)
+
+    stats = {}
+    accumulators = {}
+    for row, (key, sub_key) in enumerate(fields):
+        if counts[row] == 0:
+            continue
+        median = to_number(medians[row], not has_float[row] and counts[row] % 2 == 1)
+        field_stats = {
+            'mean': to_number(exact_mean(values[row][numeric[row]]), not has_float[row]),
+            # The median of an odd number of values is one of them, true/false for boolean fields
+            'median': bool(median) if all_bool[row] and counts[row] % 2 == 1 else median,
+            'count_peers': int(np.unique(ids[present[row]]).size)  # Number of peers that have this field
+        }
+        accumulator = Accumulator.from_values(values[row][numeric[row]], not has_float[row]).to_dict()
+        if sub_key is None:
+            stats[key] = field_stats
+            accumulators[key] = accumulator
+        else:
+            stats.setdefault(key, {})[sub_key] = field_stats
+            accumulators.setdefault(key, {})[sub_key] = accumulator
+
+    return {'date': date_str, 'stats': stats}, accumulators
+
+def iter_fields(fields):
+    # (key, sub_key, value) of every field of a nested {key: value} or {key: {sub_key: value}} dictionary
+    for key, value in fields.items():
+        if isinstance(value, Accumulator) or 'sum_sq' in value:
+            yield key, None, value
+        else:
+            for sub_key, sub_value in value.items():
+                yield key, sub_key, sub_value
+
+def merge_fields(merged, fields):
+    # Merges accumulator dictionaries of one or more days into {key: Accumulator} / {key: {sub_key: Accumulator}}
+    for key, sub_key, data in iter_fields(fields):
+        accumulator = data if isinstance(data, Accumulator) else Accumulator.from_dict(data)
+        target = merged if sub_key is None else merged.setdefault(key, {})
+        name = key if sub_key is None else sub_key
+        if name in target:
+            target[name].merge(accumulator)
+        else:
+            target[name] = Accumulator().merge(accumulator) if isinstance(data, Accumulator) else accumulator
+    return merged
+
+def fields_to_dict(merged):
+    return {key: value.to_dict() if isinstance(value, Accumulator) else {sub_key: accumulator.to_dict() for sub_key, accumulator in value.items()}
+            for key, value in merged.items()}
+
+def summarize_field(accumulator, count_peers=None):
+    summary = {
+        'count': accumulator.count,
+        'sum': to_number(accumulator.sum, accumulator.integer),
+        'mean': accumulator.mean(),
+        'std': accumulator.std(),
+        'min': to_number(accumulator.min, accumulator.integer),
+        'max': to_number(accumulator.max, accumulator.integer)
+    }
+    # Quantiles are exact as long as the field has few distinct values
+    exact = accumulator.integer and accumulator.exact is not None
+    for name, value in zip(GENERAL_QUANTILES, accumulator.quantiles(list(GENERAL_QUANTILES.values()))):
+        summary[name] = to_number(value, exact)
+    if count_peers is not None:
+        summary['count_peers'] = count_peers
+    return summary
+
+def summarize_fields(merged, daily_stats=None):
+    # count_peers of the general statistics are the peers with the field on the latest day
+    summary = {}
+    for key, sub_key, accumulator in iter_fields(merged):
+        if accumulator.count == 0:
+            continue
+        latest = (daily_stats or {}).get(key, {})
+        latest = latest if sub_key is None else latest.get(sub_key, {})
+        field_summary = summarize_field(accumulator, latest.get('count_peers'))
+        if sub_key is None:
+            summary[key] = field_summary
+        else:
+            summary.setdefault(key, {})[sub_key] = field_summary
+    return summary
+
+def get_accumulator_path(stats_folder, date_str):
+    return os.path.join(stats_folder, ACCUMULATOR_FOLDER, date_str + '.json')
+
+def load_json(file_path, default=None):
+    if not os.path.exists(file_path):
+        return default
+    with open(file_path) as file:
+        return json.load(file)
+
+def save_json(file_path, data, indent=None):
+    with open(file_path + '.tmp', 'w') as file:
+        json.dump(data, file, indent=indent)
+    os.replace(file_path + '.tmp', file_path)
+
+def get_watermark(file_path):
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+def merge_range(stats_folder, start_date=None, end_date=None):
+    # Merged accumulators of all days from start_date to end_date (datetime.date, both included)
+    merged = {}
+    for date_str in list_accumulator_dates(stats_folder):
+        day = datetime.strptime(date_str, '%d-%m-%Y').date()
+        if (start_date is None or day >= start_date) and (end_date is None or day <= end_date):
+            merge_fields(merged, load_json(get_accumulator_path(stats_folder, date_str))['fields'])
+    return merged
+
+def list_accumulator_dates(stats_folder):
+    folder = os.path.join(stats_folder, ACCUMULATOR_FOLDER)
+    dates = [file_name[:-len('.json')] for file_name in os.listdir(folder) if file_name.endswith('.json')]
+    return sorted(dates, key=lambda date_str: datetime.strptime(date_str, '%d-%m-%Y'))
+
+def update_general_stats(stats_folder, changed_dates):
+    dates = list_accumulator_dates(stats_folder)
+    if not dates:
+        return None
+    older_dates = dates[:-1]
+    state_path = os.path.join(stats_folder, GENERAL_STATE_FILE)
+    state = load_json(state_path, {'sealed': [], 'fields': {}})
+
+    # A changed or removed older day means the sealed days are merged again from their accumulators
+    if any(date_str in state['sealed'] for date_str in changed_dates) or not set(state['sealed']) <= set(older_dates):
+        state = {'sealed': [], 'fields': {}}
+    sealed = merge_fields({}, state['fields'])
+    new_dates = [date_str for date_str in older_dates if date_str not in state['sealed']]
+    for date_str in new_dates:
+        merge_fields(sealed, load_json(get_accumulator_path(stats_folder, date_str))['fields'])
+    if new_dates or not os.path.exists(state_path):
+        save_json(state_path, {'sealed': state['sealed'] + new_dates, 'fields': fields_to_dict(sealed)})
+
+    latest = dates[-1]
+    merged = merge_fields(sealed, load_json(get_accumulator_path(stats_folder, latest))['fields'])
+    latest_stats = load_json(os.path.join(stats_folder, latest + '.json'), {}).get('stats')
+    return summarize_fields(merged, latest_stats)
+
+def get_file_list(daily_folder):
+    if not os.path.isdir(daily_folder):
+        return []
+    file_names = [file_name for file_name in os.listdir(daily_folder) if file_name.endswith('.json')]
+    file_names.sort(key=lambda file_name: datetime.strptime(file_name[:-len('.json')], '%d-%m-%Y'))
+    return [os.path.join(daily_folder, file_name) for file_name in file_names]
+
+def run_stats(daily_folder, stats_folder):
+    os.makedirs(os.path.join(stats_folder, ACCUMULATOR_FOLDER), exist_ok=True)
+    file_list = get_file_list(daily_folder)
+    if not file_list:
+        print("No daily files found.")
+        return
+
+    # Only days whose daily file changed since their accumulators were written are loaded, in parallel
+    changed_files = []
+    for file_path in file_list:
+        accumulators = load_json(get_accumulator_path(stats_folder, os.path.basename(file_path).split('.')[0]))
+        if accumulators is None or accumulators['source'] != get_watermark(file_path):
+            changed_files.append(file_path)
+    if not changed_files:
+        print("Statistics are already complete for all days.")
+        return
+
+    changed_dates = []
+    with ProcessPoolExecutor() as executor:
+        watermarks = [get_watermark(file_path) for file_path in changed_files]
+        for file_path, watermark, (daily_stat, accumulators) in zip(changed_files, watermarks, executor.map(calculate_daily_stats, changed_files)):
+            date_str = os.path.basename(file_path).split('.')[0]
+            # Save daily statistics
+            if daily_stat:
+                with open(os.path.join(stats_folder, date_str + '.json'), 'w') as file:
+                    json.dump(daily_stat, file, indent=4)
+            save_json(get_accumulator_path(stats_folder, date_str), {'source': watermark, 'fields': accumulators or {}})
+            changed_dates.append(date_str)
+
+    # Save general statistics
+    general_stats = update_general_stats(stats_folder, changed_dates)
+    with open(os.path.join(stats_folder, 'general.json'), 'w') as file:
+        json.dump(general_stats, file, indent=4)
+
+def main(network=None):
+    parser = argparse.ArgumentParser(description='Daily and general statistics of the peers of a network')
+    if network is None:
+        parser.add_argument('network', choices=sorted(STATS_CONFIG), help='Network of the daily peer files')
+    parser.add_argument('--from', dest='start_date', help='Print the statistics of the days from this date (dd-mm-YYYY)')
+    parser.add_argument('--to', dest='end_date', help='Print the statistics of the days up to this date (dd-mm-YYYY)')
+    args = parser.parse_args()
+    config = STATS_CONFIG[network or args.network]
+
+    if args.start_date or args.end_date:
+        start_date = datetime.strptime(args.start_date, '%d-%m-%Y').date() if args.start_date else None
+        end_date = datetime.strptime(args.end_date, '%d-%m-%Y').date() if args.end_date else None
+        print(json.dumps(summarize_fields(merge_range(config['stats_folder'], start_date, end_date)), indent=4))
+        return
+    run_stats(config['daily_folder'], config['stats_folder'])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import json
+import dbm
+import argparse
+from datetime import datetime
+
+# Daily peer store: every new peer of a day is appended as one JSON line to <date>.jsonl,
+# <date>.addr_index is a dbm file with the addresses already stored that day and the size of the JSON Lines file they
+# cover. Lines are appended before the index is updated, so on opening the index catches up with lines it misses.
+# <date>.json (the old format, one pretty-printed list) is written on demand by export_json.
+
+data_folder = "../bitcoin-data/daily_json_files"
+date_format = "%d-%m-%Y"
+SIZE_KEY = "#jsonl_size"  # Index entry with the bytes of <date>.jsonl whose addresses are indexed, never an address
+
+def today():
+    return datetime.now().strftime(date_format)
+
+def is_date(name):
+    try:
+        datetime.strptime(name, date_format)
+        return True
+    except ValueError:
+        return False
+
+def get_jsonl_path(date, folder=data_folder):
+    return os.path.join(folder, f"{date}.jsonl")
+
+def get_index_path(date, folder=data_folder):
+    return os.path.join(folder, f"{date}.addr_index")
+
+def get_json_path(date, folder=data_folder):
+    return os.path.join(folder, f"{date}.json")
+
+def read_legacy_json(file_path):
+    try:
+        with open(file_path, 'r') as file:
+            return json.load(file)
+    except json.JSONDecodeError:
+        print(f"Error decoding JSON in file: {file_path}")
+        return []
+
+def iter_peers(date, folder=data_folder):
+    jsonl_path = get_jsonl_path(date, folder)
+    if os.path.exists(jsonl_path):
+        with open(jsonl_path, 'r') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    elif os.path.exists(get_json_path(date, folder)):
+        yield from read_legacy_json(get_json_path(date, folder))
+
+def load_peers(date, folder=data_folder):
+    return list(iter_peers(date, folder))
+
+def list_dates(folder=data_folder):
+    dates = set()
+    for filename in os.listdir(folder):
+        name, extension = os.path.splitext(filename)
+        if extension in ('.jsonl', '.json') and is_date(name):
+            dates.add(name)
+    return sorted(dates, key=lambda date: datetime.strptime(date, date_format))
+
+def migrate_legacy_file(date, folder=data_folder):
+    # A day that was started with the old collector is converted once, so its peers are not added twice
+    json_path = get_json_path(date, folder)
+    jsonl_path = get_jsonl_path(date, folder)
+    if os.path.exists(json_path) and not os.path.exists(jsonl_path):
+        with open(jsonl_path, 'w') as file:
+            for peer in read_legacy_json(json_path):
+                file.write(json.dumps(peer) + '\n')
+
+def catch_up_index(index, date, folder=data_folder):
+    # Indexes the lines appended after the last index update, e.g. by a run that stopped between writing the JSON Lines
+    # file and the index. A new or old index without a size reads the whole file. An incomplete last line is cut off,
+    # its peer is not indexed and is appended again.
+    jsonl_path = get_jsonl_path(date, folder)
+    if not os.path.exists(jsonl_path):
+        return
+    indexed = int(index[SIZE_KEY]) if SIZE_KEY in index else 0
+    size = os.path.getsize(jsonl_path)
+    if indexed == size:
+        return
+    if indexed > size:
+        indexed = 0
+
+    position = indexed
+    with open(jsonl_path, 'rb+') as file:
+        file.seek(indexed)
+        for line in file:
+            if not line.endswith(b'\n'):
+                file.truncate(position)
+                break
+            if line.strip():
+                addr = json.loads(line).get('addr')
+                if addr is not None:
+                    index[addr] = b''
+            position += len(line)
+    index[SIZE_KEY] = str(position)
+
+def open_index(date, folder=data_folder):
+    index = dbm.open(get_index_path(date, folder), 'c')
+    catch_up_index(index, date, folder)
+    return index
+
+def append_peers(peers, date=None, folder=data_folder):
+    date = date or today()
+    os.makedirs(folder, exist_ok=True)
+    migrate_legacy_file(date, folder)
+
+    new_peers = []
+    with open_index(date, folder) as index:
+        seen = set()
+        for peer in peers:
+            addr = peer.get('addr')
+            if addr is None or addr in seen or addr in index:
+                continue
+            seen.add(addr)
+            new_peers.append(peer)
+
+        if new_peers:
+            with open(get_jsonl_path(date, folder), 'a') as file:
+                file.write(''.join(json.dumps(peer) + '\n' for peer in new_peers))
+                size = file.tell()
+            for peer in new_peers:
+                index[peer['addr']] = b''
+            index[SIZE_KEY] = str(size)
+
+    return new_peers
+
+def export_json(date, folder=data_folder, force=False):
+    # Writes <date>.json for scripts that still read the old format, only if the JSON Lines file is newer
+    jsonl_path = get_jsonl_path(date, folder)
+    json_path = get_json_path(date, folder)
+    if not os.path.exists(jsonl_path):
+        return json_path if os.path.exists(json_path) else None
+    if not force and os.path.exists(json_path) and os.path.getmtime(json_path) >= os.path.getmtime(jsonl_path):
+        return json_path
+
+    temp_path = json_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(load_peers(date, folder), file, indent=4)
+    os.replace(temp_path, json_path)
+    return json_path
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the daily peer store to the old <date>.json format')
+    parser.add_argument('dates', nargs='*', help='Dates to export (format: Day-Month-Year), default: all days')
+    parser.add_argument('--force', action='store_true', help='Rewrite files that are already up to date')
+    args = parser.parse_args()
+
+    for date in args.dates or list_dates():
+        json_path = export_json(date, force=args.force)
+        if json_path:
+            print(f"Exported {json_path}")
+        else:
+            print(f"No peers stored for {date}")
+
+if __name__ == "__main__":
+    main()
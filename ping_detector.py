@@ -0,0 +1,75 @@
+import math
+from collections import deque
+from statistics import median
+
+# Ping anomaly detectors for heartbeat.py. Both keep a bounded state per peer address, take the
+# (pingtime, minping) samples of one cycle and return (old_ping, new_ping, changes) from update()
+# when the cycle is anomalous, otherwise None.
+
+class RingBufferDetector:
+    # Compares the median of a cycle with the median of the last `history_size` samples
+    def __init__(self, threshold, history_size):
+        self.threshold = threshold
+        self.history_size = history_size
+        self.history = {}
+
+    def update(self, addr, samples):
+        new_ping = median(pingtime for pingtime, _ in samples)
+        anomaly = None
+        buffer = self.history.get(addr)
+        if buffer:
+            old_ping = median(pingtime for pingtime, _ in buffer)
+            if old_ping > 0 and abs(new_ping - old_ping) / old_ping > self.threshold:
+                anomaly = (old_ping, new_ping, abs(new_ping - old_ping) / old_ping)
+        else:
+            buffer = self.history[addr] = deque(maxlen=self.history_size)
+        buffer.extend(samples)
+        return anomaly
+
+    def forget(self, addresses):
+        for addr in addresses:
+            self.history.pop(addr, None)
+
+    def peers(self):
+        return set(self.history)
+
+
+class EwmaDetector:
+    # Keeps an exponentially weighted mean and variance per peer, O(1) time and memory per sample.
+    # A cycle is anomalous when its median leaves the peer's own baseline by more than `z_score`
+    # standard deviations and by more than `threshold` relative to the baseline mean.
+    def __init__(self, threshold, alpha, z_score, warmup):
+        self.threshold = threshold
+        self.alpha = alpha
+        self.z_score = z_score
+        self.warmup = warmup
+        self.state = {}  # addr -> [mean, variance, count]
+
+    def update(self, addr, samples):
+        pingtimes = [pingtime for pingtime, _ in samples]
+        new_ping = median(pingtimes)
+        anomaly = None
+        state = self.state.get(addr)
+        if state is None:
+            state = self.state[addr] = [pingtimes[0], 0.0, 0]
+        else:
+            mean, variance, count = state
+            if count >= self.warmup and mean > 0:
+                changes = abs(new_ping - mean) / mean
+                if changes > self.threshold and abs(new_ping - mean) > self.z_score * math.sqrt(variance):
+                    anomaly = (mean, new_ping, changes)
+
+        for value in pingtimes:
+            diff = value - state[0]
+            increment = self.alpha * diff
+            state[0] += increment
+            state[1] = (1 - self.alpha) * (state[1] + diff * increment)
+            state[2] += 1
+        return anomaly
+
+    def forget(self, addresses):
+        for addr in addresses:
+            self.state.pop(addr, None)
+
+    def peers(self):
+        return set(self.state)
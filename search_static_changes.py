@@ -1,6 +1,7 @@
 import os
 import json
 from datetime import datetime, timedelta
+import peer_store
 
 data_folder = '../bitcoin-data/daily_json_files/'
 analysis_folder = '../bitcoin-data/analysis/changes/'
@@ -58,25 +59,18 @@ def get_existing_addresses():
                 pass
     return existing_addresses
 
-def process_json_file(file_path, existing_addresses):
-    filename = os.path.basename(file_path)
-    current_date_str = filename.split(".")[0]
+def process_json_file(current_date_str, existing_addresses, dates):
     current_date = datetime.strptime(current_date_str, "%d-%m-%Y")
     prev_date = current_date - timedelta(days=1)
     prev_date_str = prev_date.strftime("%d-%m-%Y")
 
-    prev_file_path = os.path.join(data_folder, f"{prev_date_str}.json")
-
-    if not os.path.exists(prev_file_path):
+    if prev_date_str not in dates:
         print(f"No previous file found for {prev_date_str}. Skipping...")
         return
 
-    print(f"Processing {filename}...")
-    with open(file_path, 'r') as file:
-        current_data = json.load(file)
-    
-    with open(prev_file_path, 'r') as prev_file:
-        prev_data = json.load(prev_file)
+    print(f"Processing {current_date_str}...")
+    current_data = peer_store.load_peers(current_date_str, data_folder)
+    prev_data = peer_store.load_peers(prev_date_str, data_folder)
     
     all_addresses = set(item['addr'] for item in current_data) | set(item['addr'] for item in prev_data)
 
@@ -145,11 +139,10 @@ def is_file_after_start_date(filename, start_date):
 
 def main():
     existing_addresses = get_existing_addresses()
-    json_files = os.listdir(data_folder)
-    for filename in json_files:
-        if is_file_after_start_date(filename, start_date):
-            file_path = os.path.join(data_folder, filename)
-            process_json_file(file_path, existing_addresses)
+    dates = peer_store.list_dates(data_folder)
+    for date in dates:
+        if is_file_after_start_date(date, start_date):
+            process_json_file(date, existing_addresses, set(dates))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,193 @@
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Log segments for the hash and ping logs. Lines go to a hidden active file that is renamed to
+# <timestamp><suffix> when it gets too large or too old, so a rotation never copies or loses lines.
+# Closed segments can be compressed in a background thread. A segment is listed in manifest.jsonl
+# of its directory once it is final, consumers only read segments from the manifest.
+
+MANIFEST_FILE = "manifest.jsonl"
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+TIMESTAMP_FORMAT = '%Y-%m-%d_%H-%M-%S'
+
+def strip_compression(file_name):
+    for extension in COMPRESSION_EXTENSIONS.values():
+        if file_name.endswith(extension):
+            return file_name[:-len(extension)]
+    return file_name
+
+def open_segment(path):
+    # Opens a (possibly compressed) segment for reading text lines
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        return zstandard.open(path, 'rt')
+    return open(path, 'r')
+
+def read_manifest(directory):
+    entries = []
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as manifest:
+            for line in manifest:
+                if line.strip():
+                    entries.append(json.loads(line))
+    return entries
+
+def sealed_segments(directory, suffix):
+    # File names of all final segments in the order they were sealed. Directories without a manifest
+    # still hold files of the old copy-and-truncate rotation, these are returned sorted by name.
+    if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return sorted(f for f in os.listdir(directory) if strip_compression(f).endswith(suffix) and not f.startswith('.'))
+    files = [entry['file'] for entry in read_manifest(directory) if strip_compression(entry['file']).endswith(suffix)]
+    return [f for f in dict.fromkeys(files) if os.path.exists(os.path.join(directory, f))]
+
+
+class SegmentWriter:
+    def __init__(self, directory, suffix, max_bytes=30 * 1024 * 1024, max_age=None, compression=None):
+        if compression is not None and compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        self.directory = directory
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compression = compression
+        self.active_path = os.path.join(directory, f".active{suffix}")
+        self.lock = threading.Lock()
+        self.manifest_lock = threading.Lock()
+        self.compressor = ThreadPoolExecutor(max_workers=1) if compression else None
+        self.file = None
+        os.makedirs(directory, exist_ok=True)
+        self.recover()
+
+    def recover(self):
+        # A segment left open by a crash is sealed, sealed segments missing in the manifest (e.g. from the
+        # old rotation or a crash during compression) are registered or compressed again
+        if os.path.exists(self.active_path) and os.path.getsize(self.active_path) > 0:
+            self.seal_file(self.active_path, register=False)
+        listed = {entry['file'] for entry in read_manifest(self.directory)}
+        for file_name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, file_name)
+            if file_name.startswith('.') or file_name in listed or not strip_compression(file_name).endswith(self.suffix):
+                continue
+            if file_name.endswith(self.suffix) and self.compression:
+                self.compressor.submit(self.compress, path)
+            else:
+                self.add_to_manifest(path)
+
+    def open(self):
+        self.file = open(self.active_path, 'ab')
+        self.opened = time.time()
+
+    def write(self, text):
+        # Writes complete lines, a segment never ends in the middle of a line
+        data = text.encode() if isinstance(text, str) else text
+        with self.lock:
+            if self.file is None:
+                self.open()
+            self.file.write(data)
+            if self.file.tell() >= self.max_bytes:
+                self.roll_over()
+
+    def roll_if_due(self):
+        with self.lock:
+            if self.file is not None and self.max_age is not None and time.time() - self.opened >= self.max_age:
+                self.roll_over()
+
+    def roll_over(self):
+        empty = self.file.tell() == 0
+        self.file.close()
+        self.file = None
+        if empty:
+            os.remove(self.active_path)
+        else:
+            self.seal_file(self.active_path)
+
+    def seal_file(self, path, register=True):
+        timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+        sealed_path = os.path.join(self.directory, f"{timestamp}{self.suffix}")
+        counter = 1
+        while os.path.exists(sealed_path) or os.path.exists(sealed_path + COMPRESSION_EXTENSIONS.get(self.compression, '')):
+            sealed_path = os.path.join(self.directory, f"{timestamp}-{counter}{self.suffix}")
+            counter += 1
+        os.rename(path, sealed_path)
+        if not register:
+            return
+        if self.compressor is not None:
+            self.compressor.submit(self.compress, sealed_path)
+        else:
+            self.add_to_manifest(sealed_path)
+
+    def compress(self, path):
+        compressed_path = path + COMPRESSION_EXTENSIONS[self.compression]
+        with open(path, 'rb') as source:
+            if self.compression == 'gzip':
+                with gzip.open(compressed_path + '.tmp', 'wb') as target:
+                    shutil.copyfileobj(source, target)
+            else:
+                with zstandard.open(compressed_path + '.tmp', 'wb') as target:
+                    shutil.copyfileobj(source, target)
+        os.replace(compressed_path + '.tmp', compressed_path)
+        os.remove(path)
+        self.add_to_manifest(compressed_path)
+
+    def add_to_manifest(self, path):
+        entry = {
+            'file': os.path.basename(path),
+            'sealed': datetime.now().strftime(TIMESTAMP_FORMAT),
+            'bytes': os.path.getsize(path)
+        }
+        with self.manifest_lock:
+            with open(os.path.join(self.directory, MANIFEST_FILE), 'a') as manifest:
+                manifest.write(json.dumps(entry) + '\n')
+
+    def close(self, seal=True):
+        with self.lock:
+            if self.file is not None:
+                if seal:
+                    self.roll_over()
+                else:
+                    self.file.close()
+                    self.file = None
+        if self.compressor is not None:
+            self.compressor.shutdown(wait=True)
+
+
+def main():
+    # Producers that write to stdout can pipe into a segment writer, e.g.
+    #   <producer> | python segment_writer.py ../bitcoin-data/hashes/hash_saves _incoming_hashes.log --compression gzip
+    parser = argparse.ArgumentParser(description='Write lines from stdin into rotating log segments')
+    parser.add_argument('directory', help='Directory of the segments and the manifest')
+    parser.add_argument('suffix', help='File name suffix of the segments, e.g. _incoming_hashes.log')
+    parser.add_argument('--max-mb', type=float, default=30, help='Segment size in MB')
+    parser.add_argument('--max-age', type=float, default=None, help='Maximum segment age in seconds')
+    parser.add_argument('--compression', choices=sorted(COMPRESSION_EXTENSIONS), default=None, help='Compress sealed segments')
+    args = parser.parse_args()
+
+    writer = SegmentWriter(args.directory, args.suffix, int(args.max_mb * 1024 * 1024), args.max_age, args.compression)
+    try:
+        for line in sys.stdin.buffer:
+            writer.write(line)
+            writer.roll_if_due()
+    finally:
+        writer.close()
+
+if __name__ == "__main__":
+    main()
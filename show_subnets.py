@@ -1,26 +1,125 @@
 import os
-import re
-from collections import defaultdict
+import argparse
+import ipaddress
+import numpy as np
+from filterPeers import split_host_port
 
 output_file = "../bitcoin-data/seen_addresses.txt"
+suspect_folder = "../bitcoin-data/analysis/suspect_addr"
 
-subnets = defaultdict(int)
-
-with open(output_file, "r") as file:
-    for line in file:
-        line = line.strip()
-        match_ipv4 = re.match(r"(\d{1,3}\.\d{1,3}\.\d{1,3})\.\d{1,3}", line)
-        match_ipv6 = re.match(r"(([0-9a-fA-F]{0,4}:){1,7}[0-9a-fA-F]{0,4})[:/]", line)
-        if match_ipv4:
-            subnet = match_ipv4.group(1)
-            subnet_parts = subnet.split(".")
-            subnet_num = ".".join(subnet_parts)
-            subnets[subnet_num] += 1
-        elif match_ipv6:
-            subnet = match_ipv6.group(1)
-            subnets[subnet] += 1
-
-print(f"Subnetmask: 255.255.255.0 - /24")
-for subnet_num, count in sorted(subnets.items()):
-    if count > 1:  # Exclude subnets with only one peer
-        print(f"Subnet: {subnet_num}, Peers: {count}")
+# Every address of seen_addresses.txt is parsed once into an integer, IPv4 as uint32 and IPv6 as two uint64
+# halves, kept sorted. Masking a sorted array keeps it sorted, so the peers of every prefix of any length are
+# the runs of equal masked values and are counted in one vectorized pass. Suspected bridge addresses from the
+# *_sus.log files are a flag column that is summed over the same runs.
+
+PREFIX_RANGES = {4: (8, 32), 6: (16, 128)}
+
+def parse_host(address):
+    host, port = split_host_port(address)
+    try:
+        return ipaddress.ip_address(host)
+    except ValueError:
+        return None  # onion, i2p and malformed lines
+
+def read_suspects(folder=suspect_folder):
+    # Addresses from lines like "addr1; addr2" of all suspect logs
+    suspects = set()
+    if not os.path.isdir(folder):
+        return suspects
+    for file_name in sorted(os.listdir(folder)):
+        if not file_name.endswith("_sus.log"):
+            continue
+        with open(os.path.join(folder, file_name), "r") as file:
+            for line in file:
+                suspects.update(address.strip() for address in line.split(";") if address.strip())
+    return suspects
+
+
+class SubnetIndex:
+    def __init__(self, addresses, suspects=()):
+        suspect_hosts = {host for host in map(parse_host, suspects) if host is not None}
+        ipv4, ipv6 = [], []
+        seen_hosts = set()
+        for address in addresses:
+            host = parse_host(address)
+            if host is not None:
+                seen_hosts.add(host)
+                (ipv4 if host.version == 4 else ipv6).append((int(host), host in suspect_hosts))
+        # Suspects missing in seen_addresses.txt are still peers of their prefix
+        for host in suspect_hosts - seen_hosts:
+            (ipv4 if host.version == 4 else ipv6).append((int(host), True))
+
+        ipv4.sort()
+        self.ipv4 = np.array([value for value, flag in ipv4], dtype=np.uint32)
+        self.ipv4_suspect = np.array([flag for value, flag in ipv4], dtype=bool)
+        ipv6.sort()
+        self.ipv6_high = np.array([value >> 64 for value, flag in ipv6], dtype=np.uint64)
+        self.ipv6_low = np.array([value & 0xFFFFFFFFFFFFFFFF for value, flag in ipv6], dtype=np.uint64)
+        self.ipv6_suspect = np.array([flag for value, flag in ipv6], dtype=bool)
+
+    @classmethod
+    def from_file(cls, path=output_file, suspects=()):
+        with open(path, "r") as file:
+            return cls((line.strip() for line in file if line.strip()), suspects)
+
+    def aggregate(self, version, prefix, min_peers=1, min_suspects=0):
+        # [(network, peers, suspects)] of the prefixes with at least min_peers peers and min_suspects suspects
+        low_bound, high_bound = PREFIX_RANGES[version]
+        if not low_bound <= prefix <= high_bound:
+            raise ValueError(f"IPv{version} prefix length must be between /{low_bound} and /{high_bound}")
+
+        if version == 4:
+            mask = np.uint32((0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF)
+            columns = [self.ipv4 & mask]
+            flags = self.ipv4_suspect
+        else:
+            high_mask = np.uint64((0xFFFFFFFFFFFFFFFF << max(64 - prefix, 0)) & 0xFFFFFFFFFFFFFFFF)
+            low_mask = np.uint64((0xFFFFFFFFFFFFFFFF << min(128 - prefix, 64)) & 0xFFFFFFFFFFFFFFFF)
+            columns = [self.ipv6_high & high_mask, self.ipv6_low & low_mask]
+            flags = self.ipv6_suspect
+        if len(flags) == 0:
+            return []
+
+        change = np.zeros(len(flags) - 1, dtype=bool)
+        for column in columns:
+            change |= column[1:] != column[:-1]
+        starts = np.concatenate(([0], np.flatnonzero(change) + 1))
+        peers = np.diff(np.append(starts, len(flags)))
+        suspects = np.add.reduceat(flags.astype(np.int64), starts)
+        selected = (peers >= min_peers) & (suspects >= min_suspects)
+
+        results = []
+        for start, peer_count, suspect_count in zip(starts[selected], peers[selected], suspects[selected]):
+            value = int(columns[0][start]) if version == 4 else (int(columns[0][start]) << 64) | int(columns[1][start])
+            network = ipaddress.ip_network((value, prefix))
+            results.append((network, int(peer_count), int(suspect_count)))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peers and suspected bridge addresses per subnet')
+    parser.add_argument('--ipv4-prefix', type=int, default=24, help='IPv4 prefix length (8-32)')
+    parser.add_argument('--ipv6-prefix', type=int, default=48, help='IPv6 prefix length (16-128)')
+    parser.add_argument('--min-peers', type=int, default=2, help='Only show subnets with at least this many peers')
+    parser.add_argument('--suspects', type=int, default=None, metavar='K',
+                        help='Only show subnets with more than K suspected bridge addresses')
+    args = parser.parse_args()
+    for version, prefix in ((4, args.ipv4_prefix), (6, args.ipv6_prefix)):
+        low_bound, high_bound = PREFIX_RANGES[version]
+        if not low_bound <= prefix <= high_bound:
+            parser.error(f"IPv{version} prefix length must be between {low_bound} and {high_bound}")
+
+    suspects = read_suspects() if args.suspects is not None else ()
+    index = SubnetIndex.from_file(output_file, suspects)
+
+    for version, prefix in ((4, args.ipv4_prefix), (6, args.ipv6_prefix)):
+        print(f"IPv{version} subnets: /{prefix}")
+        if args.suspects is not None:
+            for network, peers, suspect_count in index.aggregate(version, prefix, min_suspects=args.suspects + 1):
+                print(f"Subnet: {network}, Peers: {peers}, Suspects: {suspect_count}")
+        else:
+            for network, peers, suspect_count in index.aggregate(version, prefix, min_peers=args.min_peers):
+                print(f"Subnet: {network}, Peers: {peers}")
+
+if __name__ == "__main__":
+    main()
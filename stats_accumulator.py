@@ -0,0 +1,161 @@
+import math
+import numpy as np
+
+# Mergeable statistics of one numeric field: count, sum, sum of squares, min, max and a quantile sketch.
+# Accumulators of single days are merged into any date range without reading the daily peer files again.
+#
+# The sketch keeps exact value counts while a field has at most MAX_EXACT_VALUES distinct values (version,
+# services, inbound, ...). Beyond that it switches to logarithmic buckets (like DDSketch), every quantile is
+# then within RELATIVE_ACCURACY of the true value. Merging adds counts, so the order of merges does not matter.
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+MIN_MAGNITUDE = 1e-9  # Values closer to zero are counted as zero in bucket mode
+MAX_EXACT_VALUES = 256
+
+def bucket_counts(values, weights=None):
+    # {"pos": {index: count}, "neg": {index: count}, "zero": count} of a value array, weights are value counts
+    weights = np.ones(len(values), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+    buckets = {'zero': int(weights[np.abs(values) < MIN_MAGNITUDE].sum())}
+    for name, selected in (('pos', values >= MIN_MAGNITUDE), ('neg', values <= -MIN_MAGNITUDE)):
+        indices = np.ceil(np.log(np.abs(values[selected])) / LOG_GAMMA).astype(np.int64)
+        distinct, inverse = np.unique(indices, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights[selected], minlength=len(distinct)).astype(np.int64)
+        buckets[name] = dict(zip(distinct.tolist(), counts.tolist()))
+    return buckets
+
+def exact_to_buckets(exact):
+    return bucket_counts(np.array(list(exact), dtype=np.float64), list(exact.values()))
+
+def bucket_value(index):
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+def add_counts(target, source):
+    for key, count in source.items():
+        target[key] = target.get(key, 0) + count
+
+
+class Accumulator:
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.min = None
+        self.max = None
+        self.integer = True
+        self.exact = {}  # value -> count, None in bucket mode
+        self.buckets = None
+
+    @classmethod
+    def from_values(cls, values, integer=True):
+        accumulator = cls()
+        values = np.asarray(values, dtype=np.float64)
+        accumulator.integer = integer
+        if len(values) == 0:
+            return accumulator
+        accumulator.count = len(values)
+        accumulator.sum = float(values.sum())
+        accumulator.sum_sq = float(np.square(values).sum())
+        accumulator.min = float(values.min())
+        accumulator.max = float(values.max())
+        distinct, counts = np.unique(values, return_counts=True)
+        if len(distinct) <= MAX_EXACT_VALUES:
+            accumulator.exact = dict(zip(distinct.tolist(), counts.tolist()))
+        else:
+            accumulator.exact = None
+            accumulator.buckets = bucket_counts(values)
+        return accumulator
+
+    def to_buckets(self):
+        if self.exact is not None:
+            self.buckets = exact_to_buckets(self.exact)
+            self.exact = None
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        self.count += other.count
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.integer = self.integer and other.integer
+        if self.exact is not None and other.exact is not None:
+            add_counts(self.exact, other.exact)
+            if len(self.exact) > MAX_EXACT_VALUES:
+                self.to_buckets()
+            return self
+        self.to_buckets()
+        other_buckets = other.buckets if other.exact is None else exact_to_buckets(other.exact)
+        add_counts(self.buckets['pos'], other_buckets['pos'])
+        add_counts(self.buckets['neg'], other_buckets['neg'])
+        self.buckets['zero'] += other_buckets['zero']
+        return self
+
+    def sorted_counts(self):
+        # [(value, count)] in ascending order, bucket mode uses the representative value of every bucket
+        if self.exact is not None:
+            return sorted(self.exact.items())
+        counts = [(-bucket_value(index), count) for index, count in sorted(self.buckets['neg'].items(), reverse=True)]
+        if self.buckets['zero']:
+            counts.append((0.0, self.buckets['zero']))
+        counts.extend((bucket_value(index), count) for index, count in sorted(self.buckets['pos'].items()))
+        return counts
+
+    def quantiles(self, qs):
+        # Linear interpolation between the closest ranks like numpy.quantile, q=0.5 is the median
+        if self.count == 0:
+            return [None for q in qs]
+        counts = self.sorted_counts()
+        values = np.array([value for value, count in counts])
+        cumulative = np.cumsum([count for value, count in counts])
+        results = []
+        for q in qs:
+            rank = q * (self.count - 1)
+            low, high = values[np.searchsorted(cumulative, [math.floor(rank), math.ceil(rank)], side='right')]
+            value = low + (high - low) * (rank - math.floor(rank))
+            # Bucket values never leave the observed range
+            results.append(float(min(max(value, self.min), self.max)))
+        return results
+
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def std(self):
+        if not self.count:
+            return None
+        return math.sqrt(max(self.sum_sq / self.count - self.mean() ** 2, 0.0))
+
+    def to_dict(self):
+        data = {'count': self.count, 'sum': self.sum, 'sum_sq': self.sum_sq, 'min': self.min, 'max': self.max,
+                'integer': self.integer}
+        if self.exact is not None:
+            data['exact'] = [[value, count] for value, count in sorted(self.exact.items())]
+        else:
+            data['buckets'] = {
+                'pos': sorted(self.buckets['pos'].items()),
+                'neg': sorted(self.buckets['neg'].items()),
+                'zero': self.buckets['zero']
+            }
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        accumulator = cls()
+        accumulator.count = data['count']
+        accumulator.sum = data['sum']
+        accumulator.sum_sq = data['sum_sq']
+        accumulator.min = data['min']
+        accumulator.max = data['max']
+        accumulator.integer = data['integer']
+        if 'exact' in data:
+            accumulator.exact = {value: count for value, count in data['exact']}
+        else:
+            accumulator.exact = None
+            accumulator.buckets = {
+                'pos': {index: count for index, count in data['buckets']['pos']},
+                'neg': {index: count for index, count in data['buckets']['neg']},
+                'zero': data['buckets']['zero']
+            }
+        return accumulator
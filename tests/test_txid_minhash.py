@@ -0,0 +1,41 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis'))
+from sightings import Sightings
+from txid_minhash import HOUR_US, Signatures, build_signatures, store_signatures, load_days
+
+WINDOW_START_US = 1691193600 * 1000000  # 2023-08-05 00:00:00
+PEER = "203.0.113.7:8333"
+
+def make_sightings(txids, offset_us=0):
+    sightings = Sightings()
+    for position, txid in enumerate(txids):
+        sightings.append(PEER, WINDOW_START_US + offset_us + position * 1000, txid)
+    return sightings
+
+def random_txids(count, seed=7):
+    rng = np.random.default_rng(seed)
+    return [rng.bytes(32) for _ in range(count)]
+
+def test_window_split_across_two_files_counts_each_transaction_once(tmp_path):
+    txids = random_txids(400)
+    # Both files fall into the same hour window and share 200 transactions
+    first_file = make_sightings(txids[:300])
+    second_file = make_sightings(txids[100:], offset_us=HOUR_US // 2)
+    directory = str(tmp_path)
+    store_signatures(build_signatures(first_file), directory)
+    store_signatures(build_signatures(second_file), directory)
+
+    merged = load_days(["2023-08-05"], directory)
+    whole = build_signatures(make_sightings(txids))["2023-08-05"].by_peer()
+    assert merged.keys == [(PEER, None)]
+    assert np.array_equal(merged.signatures, whole.signatures)
+    assert merged.distinct_counts()[0] == whole.distinct_counts()[0]
+    assert 400 * 0.7 < merged.distinct_counts()[0] < 400 * 1.3
+
+def test_empty_signature_has_no_transactions():
+    signatures = Signatures()
+    signatures.rows([(PEER, WINDOW_START_US)])
+    assert signatures.distinct_counts()[0] == 0